@@ -0,0 +1,310 @@
+"""
+Offline stand-ins for Gmail, Groq and the knowledge base, used by benchmark.py.
+FakeGmailService answers the googleapiclient calls gmail_api makes (list, get,
+batch, history, getProfile, attachments, send) with multipart MIME payloads and
+a fixed latency per HTTP round trip. FakeLLMClient sleeps per completion.
+Everything is generated from a seed, so runs are reproducible.
+"""
+
+import base64
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+WORDS = (
+    "order shipping refund invoice account password login delivery tracking payment "
+    "subscription cancel upgrade plan billing address warranty return exchange product "
+    "support ticket issue error update schedule meeting contract price discount quote "
+    "report access team project deadline feedback request"
+).split()
+
+# Filler words so the vocabulary has a realistic long tail; word frequencies follow Zipf's law
+SYLLABLES = "ba co de fi ga hu ji ko lu ma ne po qui ra si tu ve wo xa zo".split()
+VOCABULARY = WORDS + ["".join(pair) + "s" for pair in itertools.product(SYLLABLES, SYLLABLES, SYLLABLES[:8])]
+CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+
+SIGNATURE = "\n\n--\nJordan Lee\nCustomer Success\nSent from my phone"
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _sentence(rng, length):
+    words = rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=length)
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraphs(rng, count):
+    return "\n\n".join(" ".join(_sentence(rng, rng.randint(6, 16)) for _ in range(rng.randint(2, 5)))
+                       for _ in range(count))
+
+
+def make_message(rng, number):
+    """A Gmail message resource: multipart/mixed with text and HTML alternatives, sometimes an attachment."""
+    message_id = f"{number:016x}"
+    subject = _sentence(rng, rng.randint(3, 7)).rstrip(".")
+    text = _paragraphs(rng, rng.randint(1, 6))
+    if rng.random() < 0.5:
+        # Quoted history, as in a typical reply chain
+        text += "\n\nOn Mon, Jan 1, 2024 at 9:00 AM Support <support@example.com> wrote:\n> " + \
+            _paragraphs(rng, 2).replace("\n", "\n> ")
+    text += SIGNATURE
+    html = "<html><body>" + "".join(f"<p>{p}</p>" for p in text.split("\n\n")) + "</body></html>"
+
+    parts = [{
+        "partId": "0",
+        "mimeType": "multipart/alternative",
+        "filename": "",
+        "headers": [{"name": "Content-Type", "value": "multipart/alternative; boundary=alt"}],
+        "body": {"size": 0},
+        "parts": [
+            {"partId": "0.0", "mimeType": "text/plain", "filename": "",
+             "headers": [{"name": "Content-Type", "value": "text/plain; charset=UTF-8"}],
+             "body": {"size": len(text), "data": _encode(text)}},
+            {"partId": "0.1", "mimeType": "text/html", "filename": "",
+             "headers": [{"name": "Content-Type", "value": "text/html; charset=UTF-8"}],
+             "body": {"size": len(html), "data": _encode(html)}},
+        ],
+    }]
+    if rng.random() < 0.2:
+        parts.append({
+            "partId": "1", "mimeType": "application/pdf", "filename": f"invoice-{number}.pdf",
+            "headers": [{"name": "Content-Disposition", "value": f'attachment; filename="invoice-{number}.pdf"'}],
+            "body": {"size": 48000, "attachmentId": f"att-{message_id}"},
+        })
+
+    sender = f"customer{rng.randint(1, 5000)}@example.com"
+    return {
+        "id": message_id,
+        "threadId": f"t{message_id}",
+        "labelIds": ["INBOX", "UNREAD"],
+        "internalDate": str(1700000000000 + number * 60000),
+        "payload": {
+            "partId": "",
+            "mimeType": "multipart/mixed",
+            "filename": "",
+            "headers": [
+                {"name": "From", "value": sender},
+                {"name": "To", "value": "me@example.com"},
+                {"name": "Subject", "value": subject},
+                {"name": "Date", "value": "Mon, 1 Jan 2024 09:00:00 +0000"},
+                {"name": "Message-ID", "value": f"<{message_id}@example.com>"},
+                {"name": "Content-Type", "value": "multipart/mixed; boundary=mixed"},
+            ],
+            "body": {"size": 0},
+            "parts": parts,
+        },
+    }
+
+
+def http_error(status, reason=""):
+    """HttpError as googleapiclient raises it for a `status` response."""
+    content = json.dumps({"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}})
+    return HttpError(httplib2.Response({"status": status}), content.encode("utf-8"))
+
+
+def _metadata_only(resource):
+    """Drop body data, as format='metadata' does."""
+    payload = dict(resource["payload"])
+    payload.pop("parts", None)
+    payload["body"] = {"size": 0}
+    return dict(resource, payload=payload)
+
+
+class FakeRequest:
+    def __init__(self, service, fn):
+        self._service = service
+        self._fn = fn
+
+    def execute(self, num_retries=0):
+        self._service._round_trip()
+        return self._fn()
+
+
+class FakeBatch:
+    """Collects requests and runs them in a single simulated round trip."""
+
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._service._round_trip()
+        for request_id, request in self._requests:
+            status = self._service.batch_errors.pop(request_id, None)
+            if status is not None:
+                self._callback(request_id, None, http_error(status))
+                continue
+            try:
+                response = request._fn()
+            except HttpError as e:
+                self._callback(request_id, None, e)
+            else:
+                self._callback(request_id, response, None)
+
+
+class _Resource:
+    """Routes users().messages()/history()/attachments() calls to the service."""
+
+    def __init__(self, service):
+        self._service = service
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return SimpleNamespace(list=self._service._history_list)
+
+    def attachments(self):
+        return SimpleNamespace(get=self._service._attachment_get)
+
+    def getProfile(self, userId):
+        return FakeRequest(self._service, lambda: {"emailAddress": "me@example.com",
+                                                   "historyId": str(self._service.history_id)})
+
+    def list(self, userId, labelIds=None, q=None, maxResults=100, pageToken=None, **kwargs):
+        return FakeRequest(self._service, lambda: self._service._list(maxResults, pageToken))
+
+    def get(self, userId, id, format="full", fields=None, metadataHeaders=None):
+        return FakeRequest(self._service, lambda: self._service._get(id, format))
+
+    def send(self, userId, body):
+        return FakeRequest(self._service, lambda: self._service._send(body))
+
+
+class FakeGmailService:
+    """
+    In-memory Gmail inbox of `message_count` unread messages, newest first.
+    Every execute() and every batch costs `latency` seconds; round trips are counted.
+    `batch_errors` maps message IDs to a status their next batched get fails with
+    (e.g. 429); getting a message removed from `messages` fails with 404.
+    """
+
+    def __init__(self, message_count, latency=0.02, seed=0):
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.messages = {}
+        self.order = []
+        self.history = []
+        self.history_id = 1000
+        self.round_trips = 0
+        self.sent = 0
+        self.batch_errors = {}
+        self.add_messages(message_count, record_history=False)
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_messages(self, count, record_history=True):
+        """Deliver `count` new unread messages, recorded in history for incremental sync."""
+        added = []
+        for _ in range(count):
+            resource = make_message(self._rng, len(self.messages))
+            self.messages[resource["id"]] = resource
+            self.order.insert(0, resource["id"])
+            added.append({"message": {"id": resource["id"], "labelIds": resource["labelIds"]}})
+        if record_history and added:
+            self.history_id += 1
+            self.history.append({"id": str(self.history_id), "messagesAdded": added})
+
+    def users(self):
+        return _Resource(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def _list(self, max_results, page_token):
+        start = int(page_token or 0)
+        ids = self.order[start:start + max_results]
+        result = {"messages": [{"id": message_id, "threadId": f"t{message_id}"} for message_id in ids],
+                  "resultSizeEstimate": len(self.order)}
+        if start + max_results < len(self.order):
+            result["nextPageToken"] = str(start + max_results)
+        return result
+
+    def _get(self, message_id, format):
+        resource = self.messages.get(message_id)
+        if resource is None:
+            raise http_error(404, "notFound")
+        return resource if format == "full" else _metadata_only(resource)
+
+    def _history_list(self, userId, startHistoryId, pageToken=None, **kwargs):
+        records = [record for record in self.history if int(record["id"]) > int(startHistoryId)]
+        return FakeRequest(self, lambda: {"history": records, "historyId": str(self.history_id)})
+
+    def _attachment_get(self, userId, messageId, id):
+        data = _encode("%PDF-1.4 " + "0" * 48000)
+        return FakeRequest(self, lambda: {"size": 48000, "data": data})
+
+    def _send(self, body):
+        with self._lock:
+            self.sent += 1
+            return {"id": f"sent{self.sent}", "threadId": body.get("threadId"), "labelIds": ["SENT"]}
+
+
+BATCH_ID_RE = re.compile(r"^### Email id: (\S+)$", re.MULTILINE)
+
+
+class _FakeCompletions:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model=None, messages=None, stream=False, response_format=None, **kwargs):
+        self._client._count()
+        time.sleep(self._client.latency)
+        prompt = messages[-1]["content"]
+        if response_format:
+            ids = BATCH_ID_RE.findall(prompt)
+            text = json.dumps({message_id: "The customer asks about their order." for message_id in ids})
+        else:
+            text = "Thanks for reaching out! " * max(1, self._client.reply_words // 4)
+        if stream:
+            return self._stream(text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+    def _stream(self, text):
+        for word in text.split(" "):
+            time.sleep(self._client.chunk_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+
+
+class FakeLLMClient:
+    """Groq-compatible client whose completions take `latency` seconds; JSON mode answers batch prompts."""
+
+    def __init__(self, latency=0.3, chunk_latency=0.01, reply_words=60):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.reply_words = reply_words
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+
+def generate_knowledge_base(size, seed=0):
+    """`size` distinct question/answer entries drawn from the same vocabulary as the fake inbox."""
+    rng = random.Random(seed)
+    return [
+        {"question": f"{_sentence(rng, rng.randint(5, 12))[:-1]}? (#{n})",
+         "answer": " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(1, 4)))}
+        for n in range(size)
+    ]
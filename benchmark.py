@@ -0,0 +1,215 @@
+"""
+Offline benchmark suite.
+Times the Gmail fetch/sync paths, knowledge base load/update/search and the
+drafting loops against the fakes in bench_fakes.py, and writes the results as
+JSON so runs can be compared over time.
+
+Full run:    python benchmark.py
+Quick run:   python benchmark.py --quick
+Compare:     python benchmark.py --output before.json  (then again after a change)
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import metrics
+from bench_fakes import FakeGmailService, FakeLLMClient, generate_knowledge_base
+from clustering import cluster_emails
+from gmail_api import (
+    get_unread_emails,
+    sync_unread_emails,
+    load_knowledge_base,
+    find_relevant_knowledge,
+    update_knowledge_base,
+    RETRIEVAL_BACKENDS
+)
+from llm_engine import chat_completion, generate_drafts, summarize_many
+from message_store import MessageStore
+from prompt_builder import draft_reply_prompt, summary_prompt
+
+DEFAULT_OUTPUT = "bench_results.json"
+DEFAULT_KB_SIZES = [1000, 10000, 100000]
+DEFAULT_EMAILS = 500
+DEFAULT_DRAFT_EMAILS = 40
+KB_UPDATE_ENTRIES = 100
+SEARCH_QUERIES = 50
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_gmail(results, email_count, latency):
+    service = FakeGmailService(email_count, latency=latency)
+    emails, seconds = timed(get_unread_emails, service=service)
+    results.append({"name": "gmail.get_unread_emails", "params": {"emails": email_count, "latency": latency},
+                    "seconds": seconds, "round_trips": service.round_trips,
+                    "emails_per_second": len(emails) / seconds if seconds else None})
+
+    _, seconds = timed(lambda: [email['body'] for email in emails])
+    results.append({"name": "gmail.decode_bodies", "params": {"emails": email_count}, "seconds": seconds})
+
+    clusters, seconds = timed(cluster_emails, emails)
+    results.append({"name": "emails.cluster", "params": {"emails": email_count}, "seconds": seconds,
+                    "clusters": len(clusters)})
+
+    service.round_trips = 0
+    _, seconds = timed(get_unread_emails, service=service, include_body=False)
+    results.append({"name": "gmail.get_unread_emails_metadata", "params": {"emails": email_count, "latency": latency},
+                    "seconds": seconds, "round_trips": service.round_trips})
+
+
+def bench_sync(results, email_count, latency, workdir):
+    service = FakeGmailService(email_count, latency=latency)
+    store = MessageStore(os.path.join(workdir, "bench_messages.db"))
+    try:
+        _, seconds = timed(lambda: list(sync_unread_emails(store, service=service)))
+        results.append({"name": "gmail.sync_full", "params": {"emails": email_count, "latency": latency},
+                        "seconds": seconds, "round_trips": service.round_trips})
+
+        service.add_messages(20)
+        service.round_trips = 0
+        _, seconds = timed(lambda: list(sync_unread_emails(store, service=service)))
+        results.append({"name": "gmail.sync_incremental", "params": {"emails": email_count, "new": 20},
+                        "seconds": seconds, "round_trips": service.round_trips})
+    finally:
+        store.close()
+
+
+def bench_knowledge_base(results, size, backends, queries, workdir):
+    path = os.path.join(workdir, f"kb_{size}.json")
+    entries = generate_knowledge_base(size)
+    with open(path, "w") as f:
+        json.dump(entries, f)
+
+    knowledge_base, seconds = timed(load_knowledge_base, path)
+    results.append({"name": "kb.load_cold", "params": {"entries": size}, "seconds": seconds})
+    _, seconds = timed(load_knowledge_base, path)
+    results.append({"name": "kb.load_warm", "params": {"entries": size}, "seconds": seconds})
+
+    for backend in backends:
+        # The first search builds (or loads) the index for this backend
+        _, seconds = timed(find_relevant_knowledge, queries[0], knowledge_base, file_path=path, backend=backend)
+        results.append({"name": "kb.index_build", "params": {"entries": size, "backend": backend}, "seconds": seconds})
+
+        samples = []
+        for query in queries:
+            _, seconds = timed(find_relevant_knowledge, query, knowledge_base, file_path=path, backend=backend)
+            samples.append(seconds)
+        results.append({"name": "kb.search", "params": {"entries": size, "backend": backend, "queries": len(queries)},
+                        "seconds": sum(samples), "mean_ms": statistics.mean(samples) * 1000,
+                        "p95_ms": _percentile(samples, 0.95) * 1000})
+
+    new_entries = generate_knowledge_base(KB_UPDATE_ENTRIES, seed=size + 1)
+    for entry in new_entries:
+        entry['question'] += " (new)"
+    _, seconds = timed(update_knowledge_base, new_entries, path)
+    results.append({"name": "kb.update", "params": {"entries": size, "added": KB_UPDATE_ENTRIES}, "seconds": seconds})
+
+    knowledge_base = load_knowledge_base(path)
+    for backend in backends:
+        _, seconds = timed(find_relevant_knowledge, queries[0], knowledge_base, file_path=path, backend=backend)
+        results.append({"name": "kb.search_after_update", "params": {"entries": size, "backend": backend},
+                        "seconds": seconds})
+
+
+def bench_drafts(results, emails, latency, workers):
+    prompts = [draft_reply_prompt(email['body'])['messages'] for email in emails]
+    params = {"emails": len(emails), "latency": latency}
+
+    client = FakeLLMClient(latency=latency)
+    _, seconds = timed(lambda: [chat_completion(client, messages) for messages in prompts])
+    results.append({"name": "llm.drafts_sequential", "params": params, "seconds": seconds, "calls": client.calls})
+
+    client = FakeLLMClient(latency=latency)
+    _, seconds = timed(lambda: list(generate_drafts(client, dict(enumerate(prompts)), max_workers=workers)))
+    results.append({"name": "llm.drafts_concurrent", "params": dict(params, workers=workers),
+                    "seconds": seconds, "calls": client.calls})
+
+    client = FakeLLMClient(latency=latency)
+    summaries = {email['id']: summary_prompt(email['body'])['messages'] for email in emails}
+    _, seconds = timed(lambda: list(generate_drafts(client, summaries, max_workers=workers)))
+    results.append({"name": "llm.summaries_single", "params": dict(params, workers=workers),
+                    "seconds": seconds, "calls": client.calls})
+
+    client = FakeLLMClient(latency=latency)
+    _, seconds = timed(lambda: list(summarize_many(client, emails, max_workers=workers)))
+    results.append({"name": "llm.summaries_batched", "params": dict(params, workers=workers),
+                    "seconds": seconds, "calls": client.calls})
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        print("📥 Gmail...", file=sys.stderr)
+        bench_gmail(results, args.emails, args.gmail_latency)
+        bench_sync(results, args.emails, args.gmail_latency, workdir)
+
+        # Queries are bodies of fake emails, so they share the KB's vocabulary
+        queries = [email['body'] for email in get_unread_emails(service=FakeGmailService(SEARCH_QUERIES, latency=0))]
+        for size in args.kb_sizes:
+            print(f"📚 Knowledge base ({size} entries)...", file=sys.stderr)
+            bench_knowledge_base(results, size, args.backends, queries, workdir)
+
+        print("🤖 Drafting...", file=sys.stderr)
+        draft_emails = get_unread_emails(service=FakeGmailService(args.draft_emails, latency=0))
+        bench_drafts(results, draft_emails, args.llm_latency, args.workers)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Gmail, knowledge base and LLM paths against offline fakes.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the JSON results")
+    parser.add_argument("--emails", type=int, default=DEFAULT_EMAILS, help="messages in the fake inbox")
+    parser.add_argument("--kb-sizes", type=int, nargs="+", default=DEFAULT_KB_SIZES)
+    parser.add_argument("--backends", nargs="+", choices=RETRIEVAL_BACKENDS, default=list(RETRIEVAL_BACKENDS))
+    parser.add_argument("--draft-emails", type=int, default=DEFAULT_DRAFT_EMAILS)
+    parser.add_argument("--gmail-latency", type=float, default=0.02, help="seconds per Gmail round trip")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per LLM completion")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent LLM requests")
+    parser.add_argument("--quick", action="store_true", help="small sizes for a smoke run")
+    args = parser.parse_args()
+    if args.quick:
+        args.emails = min(args.emails, 100)
+        args.kb_sizes = [1000]
+        args.draft_emails = min(args.draft_emails, 12)
+        args.llm_latency = min(args.llm_latency, 0.05)
+
+    started = time.perf_counter()
+    results = run(args)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "total_seconds": time.perf_counter() - started,
+        },
+        "results": results,
+        # Per-operation call counts and latency histograms gathered while the benchmarks ran
+        "metrics": metrics.snapshot(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        params = ", ".join(f"{k}={v}" for k, v in result['params'].items())
+        print(f"{result['name']:<34} {result['seconds']:>9.3f}s  {params}")
+    print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
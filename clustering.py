@@ -0,0 +1,124 @@
+"""
+Near-duplicate email clustering.
+Bodies are normalized (quoted history, signatures, links, addresses and numbers
+removed) and split into word shingles. MinHash signatures with LSH banding find
+candidate pairs. Two clusters are joined only when every pair of members has an
+exact shingle Jaccard similarity above the threshold, so clusters never chain
+together emails that differ. Retrieval and drafting can then run once per cluster.
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+from prompt_builder import strip_quoted_and_signature
+
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: pairs above ~0.5 Jaccard almost always land in a shared bucket
+BANDS = 16
+# Conservative: every member gets the same draft, so only near-identical emails should share one
+DEFAULT_THRESHOLD = 0.7
+SHINGLE_SIZE = 3
+# Emails with fewer normalized words than this (e.g. "Thanks!") say too little to share a draft
+MIN_WORDS = 8
+
+# Smallest prime above 2**32; with 32-bit hashes and coefficients a*x + b stays within uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(42)
+_A = _rng.randint(1, 2 ** 32, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+URL_RE = re.compile(r"(https?://|www\.)\S+")
+EMAIL_RE = re.compile(r"\S+@\S+\.\w+")
+# Order numbers, dates, amounts and the like vary between otherwise identical emails
+NUMBER_RE = re.compile(r"\w*\d[\w\-/.,:]*")
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Words of the email that matter for duplicate detection."""
+    text = strip_quoted_and_signature(text).lower()
+    text = URL_RE.sub(" url ", text)
+    text = EMAIL_RE.sub(" address ", text)
+    text = NUMBER_RE.sub(" num ", text)
+    return WORD_RE.findall(text)
+
+
+def shingles(words, size=SHINGLE_SIZE):
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set):
+    """MinHash signature of a shingle set (NUM_PERMUTATIONS uint64 values)."""
+    if not shingle_set:
+        return np.full(NUM_PERMUTATIONS, _PRIME, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+                         dtype=np.uint64, count=len(shingle_set))
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0)
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def email_text(email):
+    """Body, or the subject for emails without one."""
+    return email.get('body') or email.get('subject', '')
+
+
+def cluster_emails(emails, threshold=DEFAULT_THRESHOLD):
+    """
+    Group near-duplicate emails. Returns clusters as lists of indices into `emails`
+    (members in input order, clusters ordered by their first member); emails with
+    no near-duplicate come back as single-member clusters.
+    """
+    shingle_sets = []
+    for email in emails:
+        words = normalize(email_text(email))
+        # Nothing much to compare; a near-empty email is nobody's duplicate
+        shingle_sets.append(shingles(words) if len(words) >= MIN_WORDS else set())
+    signatures = [minhash(shingle_set) for shingle_set in shingle_sets]
+    parent = list(range(len(emails)))
+    members_of = {i: [i] for i in range(len(emails))}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERMUTATIONS // BANDS
+    for band in range(BANDS):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            if not shingle_sets[i]:
+                continue
+            buckets.setdefault(signature[band * rows:(band + 1) * rows].tobytes(), []).append(i)
+        for members in buckets.values():
+            for n, i in enumerate(members[1:], start=1):
+                for j in members[:n]:
+                    root_i, root_j = find(i), find(j)
+                    if root_i == root_j:
+                        continue
+                    # Estimated Jaccard similarity (share of matching signature values) as a cheap
+                    # filter, then the exact similarity of every pair the merge would join
+                    if np.mean(signatures[i] == signatures[j]) < threshold:
+                        continue
+                    if all(jaccard(shingle_sets[a], shingle_sets[b]) >= threshold
+                           for a in members_of[root_i] for b in members_of[root_j]):
+                        root, child = min(root_i, root_j), max(root_i, root_j)
+                        parent[child] = root
+                        members_of[root] += members_of.pop(child)
+
+    clusters = {}
+    for i in range(len(emails)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda members: members[0])
+
+
+def cluster_lookup(clusters):
+    """{index: its cluster's member list}"""
+    return {i: members for members in clusters for i in members}
@@ -1,126 +1,518 @@
+import datetime
+import heapq
+import itertools
 import os
 import pickle
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 import base64
 import email
-import json
+from email.message import EmailMessage
+import metrics
+from kb_index import get_index, index_path_for
+from kb_store import get_store
+from mime_parser import ParsedMessage, decode_base64url
+from rate_limit import error_status, is_retryable
+from kb_embeddings import get_embedding_index, vectors_path_for
 
-def load_knowledge_base(file_path="knowledge_base.json"):
-    """Load the knowledge base from a JSON file."""
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+DEFAULT_KB_PATH = "knowledge_base.json"
 
-def find_relevant_knowledge(email_body, knowledge_base):
+# Number of knowledge base entries passed to the LLM as context
+DEFAULT_TOP_K = 5
+
+# "bm25" for keyword ranking or "semantic" for embedding similarity
+RETRIEVAL_BACKENDS = ("bm25", "semantic")
+DEFAULT_RETRIEVAL_BACKEND = "bm25"
+
+@metrics.instrumented("kb.load")
+def load_knowledge_base(file_path=DEFAULT_KB_PATH):
+    """
+    Load the knowledge base. Entries live in a SQLite store next to the JSON file
+    (imported from it when the JSON changes) and are cached in process until the
+    store is modified, so repeated calls don't touch disk.
+    """
+    return get_store(file_path).entries()
+
+def search_knowledge(email_body, knowledge_base, top_k=DEFAULT_TOP_K, file_path=DEFAULT_KB_PATH,
+                     backend=DEFAULT_RETRIEVAL_BACKEND):
+    """
+    Rank knowledge base entries against an email body.
+    `backend` is "bm25" (keyword index) or "semantic" (embedding index); both are
+    persisted next to the knowledge base file and only extended for new entries.
+    Returns up to `top_k` (entry, score) pairs, best first.
+    """
+    return search_knowledge_many([email_body], knowledge_base, top_k, file_path, backend)[0]
+
+def search_knowledge_many(email_bodies, knowledge_base, top_k=DEFAULT_TOP_K, file_path=DEFAULT_KB_PATH,
+                          backend=DEFAULT_RETRIEVAL_BACKEND):
+    """Rank knowledge base entries for many emails at once; one result list per body."""
+    if backend not in RETRIEVAL_BACKENDS:
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+    with metrics.timer(f"kb.search.{backend}"):
+        if backend == "semantic":
+            index = get_embedding_index(knowledge_base, vectors_path_for(file_path))
+            hits = index.search_many(email_bodies, top_k)
+        else:
+            index = get_index(knowledge_base, index_path_for(file_path))
+            hits = [index.search(body, top_k) for body in email_bodies]
+    return [[(knowledge_base[doc_id], score) for doc_id, score in ranked] for ranked in hits]
+
+def find_relevant_knowledge(email_body, knowledge_base, top_k=DEFAULT_TOP_K, file_path=DEFAULT_KB_PATH,
+                            backend=DEFAULT_RETRIEVAL_BACKEND):
     """
     Find the most relevant knowledge base entries for a given email body.
-    This is a simple implementation; more advanced versions could use NLP for semantic search.
-    """
-    email_lower = email_body.lower()
-    relevant_knowledge = []
-    
-    for entry in knowledge_base:
-        question_lower = entry['question'].lower()
-        # Simple keyword matching; works well for FAQs
-        if any(keyword in email_lower for keyword in question_lower.split()):
-            relevant_knowledge.append(entry)
-            
-    return relevant_knowledge
-
-def update_knowledge_base(new_entries, file_path="knowledge_base.json"):
-    """Loads, updates, and saves the knowledge base, avoiding duplicates."""
-    existing_knowledge = load_knowledge_base(file_path)
-    
-    # Use a dictionary to easily check for existing questions
-    existing_questions = {entry['question'].lower().strip(): entry for entry in existing_knowledge}
-    
-    added_count = 0
-    for new_entry in new_entries:
-        question = new_entry.get('question', '')
-        if question:
-            question_lower = question.lower().strip()
-            if question_lower not in existing_questions:
-                existing_knowledge.append(new_entry)
-                existing_questions[question_lower] = new_entry
-                added_count += 1
-            
-    # Save the updated knowledge base with pretty printing
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(existing_knowledge, f, indent=2, ensure_ascii=False)
-        
+    By default entries are ranked with BM25 over their questions and answers (stopwords
+    ignored); backend="semantic" uses vector-embedding similarity instead.
+    """
+    return [entry for entry, _ in search_knowledge(email_body, knowledge_base, top_k, file_path, backend)]
+
+@metrics.instrumented("kb.update")
+def update_knowledge_base(new_entries, file_path=DEFAULT_KB_PATH):
+    """Adds new entries to the knowledge base in one atomic transaction, avoiding duplicates."""
+    store = get_store(file_path)
+    added_count = store.add_entries(new_entries)
+
+    # New entries are appended, so the search index only has to index those
+    if added_count:
+        get_index(store.entries(), index_path_for(file_path))
+
     return added_count
 
-def get_gmail_service():
-    """Get Gmail service with proper authentication"""
+def export_knowledge_base(file_path=DEFAULT_KB_PATH, export_path=None):
+    """Write the knowledge base out as a JSON list; returns the path written."""
+    return get_store(file_path).export_json(export_path)
+
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+TOKEN_PATH = 'token.pickle'
+CREDENTIALS_PATH = 'credentials.json'
+
+# Refresh access tokens a little before they expire so no request races the expiry
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+HTTP_TIMEOUT = 60
+# Idle Gmail services (each with its own keep-alive connection) kept per account
+SERVICE_POOL_SIZE = 8
+
+# Named account profiles live in accounts/<name>/; the default account keeps using the working directory
+ACCOUNTS_DIR = "accounts"
+DEFAULT_ACCOUNT = "default"
+
+# Gmail API quota units per call; each user may spend 250 units per second
+QUOTA_UNITS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.send": 100,
+    "history.list": 2,
+    "getProfile": 1,
+    "attachments.get": 5,
+}
+
+_credentials = {}
+_credentials_lock = threading.Lock()
+_service_pools = {}
+
+def account_path(account, filename):
+    """Path of an account's `filename` (token, credentials or message cache)."""
+    if account == DEFAULT_ACCOUNT:
+        return filename
+    return os.path.join(ACCOUNTS_DIR, account, filename)
+
+def list_accounts():
+    """Names of the accounts that have a token or credentials file, default first."""
+    def has_credentials(account):
+        return any(os.path.exists(account_path(account, name)) for name in (TOKEN_PATH, CREDENTIALS_PATH))
+
+    accounts = [DEFAULT_ACCOUNT] if has_credentials(DEFAULT_ACCOUNT) else []
+    if os.path.isdir(ACCOUNTS_DIR):
+        accounts += [name for name in sorted(os.listdir(ACCOUNTS_DIR))
+                     if name != DEFAULT_ACCOUNT and has_credentials(name)]
+    return accounts
+
+class _CountingHttp(httplib2.Http):
+    """httplib2.Http that records bytes sent and received for the diagnostics panel"""
+
+    def request(self, uri, method="GET", body=None, *args, **kwargs):
+        response, content = super().request(uri, method, body, *args, **kwargs)
+        metrics.add("gmail.http", bytes_sent=len(body or b""), bytes_received=len(content or b""))
+        return response, content
+
+def _execute(request, op, account=DEFAULT_ACCOUNT, units=None, **kwargs):
+    """
+    Run a Gmail API request (or batch), timed as operation `op`. The quota units it
+    costs are charged to the account, since Gmail enforces quota per user.
+    """
+    metrics.add(f"gmail.quota.{account}", quota_units=QUOTA_UNITS.get(op, 0) if units is None else units)
+    with metrics.timer(f"gmail.{op}"):
+        return request.execute(**kwargs)
+
+def _load_credentials(account=DEFAULT_ACCOUNT):
     creds = None
-    
+    token_path = account_path(account, TOKEN_PATH)
+    credentials_path = account_path(account, CREDENTIALS_PATH)
+
     # Try to load from token.pickle first
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
+    if os.path.exists(token_path):
+        with open(token_path, 'rb') as token:
             creds = pickle.load(token)
-    
+
     # If no token.pickle, try credentials.json
-    elif os.path.exists('credentials.json'):
-        creds = Credentials.from_authorized_user_file("credentials.json", scopes=["https://www.googleapis.com/auth/gmail.modify"])
-    
-    # If credentials are expired, refresh them
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        # Save refreshed credentials
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-    
+    elif os.path.exists(credentials_path):
+        creds = Credentials.from_authorized_user_file(credentials_path, scopes=GMAIL_SCOPES)
+
     if not creds:
+        setup = "python gmail_setup.py" if account == DEFAULT_ACCOUNT else f"python gmail_setup.py --account {account}"
         raise FileNotFoundError(
-            "No Gmail credentials found. Please run 'python gmail_setup.py' first to authenticate."
+            f"No Gmail credentials found for account '{account}'. Please run '{setup}' first to authenticate."
         )
-    
-    service = build("gmail", "v1", credentials=creds)
-    return service
-
-def get_unread_emails():
-    service = get_gmail_service()
-    result = service.users().messages().list(userId='me', labelIds=['INBOX'], q="is:unread").execute()
-    messages = result.get('messages', [])
-
-    emails = []
-    for msg in messages:
-        msg_data = service.users().messages().get(userId='me', id=msg['id']).execute()
-        headers = msg_data['payload']['headers']
-        payload = msg_data['payload']
-        parts = payload.get('parts', [payload.get('body', {})])
-
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), "Unknown")
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), "No Subject")
-        date = next((h['value'] for h in headers if h['name'] == 'Date'), "Unknown Date")
-        thread_id = msg_data['threadId']
-
-        # Decode message body
-        body_data = ''
-        for part in parts:
-            if 'body' in part and 'data' in part['body']:
-                body_data = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                break
-
-        emails.append({
-            "sender": sender,
-            "subject": subject,
-            "date": date,
-            "body": body_data,
-            "thread_id": thread_id
-        })
-    return emails
-
-def send_email_reply(to, subject, body, thread_id):
-    service = get_gmail_service()
-    message = f"To: {to}\r\nSubject: {subject}\r\nIn-Reply-To: {thread_id}\r\n\r\n{body}"
-    raw = base64.urlsafe_b64encode(message.encode("utf-8")).decode("utf-8")
-    message = {
-        'raw': raw,
-        'threadId': thread_id
-    }
-    service.users().messages().send(userId='me', body=message).execute()
+    return creds
+
+def _needs_refresh(creds):
+    if not creds.refresh_token:
+        return False
+    if creds.expiry is None:
+        return not creds.valid
+    # google-auth stores expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return creds.expiry - TOKEN_REFRESH_MARGIN <= now
+
+def get_credentials(account=DEFAULT_ACCOUNT):
+    """
+    Process-wide Gmail credentials of an account, loaded once and refreshed under a
+    lock shortly before they expire. Cheap enough to call on every Streamlit rerun.
+    """
+    with _credentials_lock:
+        creds = _credentials.get(account)
+        if creds is None:
+            creds = _credentials[account] = _load_credentials(account)
+        if _needs_refresh(creds):
+            creds.refresh(Request())
+            # Save refreshed credentials
+            with open(account_path(account, TOKEN_PATH), 'wb') as token:
+                pickle.dump(creds, token)
+        return creds
+
+def reset_gmail_service(account=None):
+    """Forget cached credentials and services of one account (or all), e.g. after re-authenticating."""
+    with _credentials_lock:
+        if account is None:
+            _credentials.clear()
+            _service_pools.clear()
+        else:
+            _credentials.pop(account, None)
+            _service_pools.pop(account, None)
+
+def _service_pool(account):
+    with _credentials_lock:
+        pool = _service_pools.get(account)
+        if pool is None:
+            pool = _service_pools[account] = queue.Queue(maxsize=SERVICE_POOL_SIZE)
+        return pool
+
+@contextmanager
+def gmail_service(account=DEFAULT_ACCOUNT, service=None):
+    """
+    Check out an authenticated Gmail service of an account for the duration of the block
+    (or use `service` as is when one is given).
+    Services are built from the bundled static discovery document and kept in a
+    process-wide pool per account, so their keep-alive connections are reused by later
+    calls on any thread (Streamlit reruns and worker pools start new threads).
+    An httplib2 connection can't be used by two threads at once, so each checkout
+    has the service to itself; a new one is built when the pool is empty.
+    """
+    if service is not None:
+        yield service
+        return
+    creds = get_credentials(account)
+    pool = _service_pool(account)
+    try:
+        pooled_creds, service = pool.get_nowait()
+    except queue.Empty:
+        pooled_creds = None
+    if pooled_creds is not creds:
+        # Empty pool, or the credentials were reloaded since this service was built
+        http = AuthorizedHttp(creds, http=_CountingHttp(timeout=HTTP_TIMEOUT))
+        service = build("gmail", "v1", http=http, static_discovery=True, cache_discovery=False)
+    try:
+        yield service
+    except (HttpError, GeneratorExit):
+        # An error response, or a generator closed between requests, leaves the connection usable
+        _return_service(pool, creds, service)
+        raise
+    # Any other error (e.g. a timeout) may leave the connection half-read, so that service is dropped
+    _return_service(pool, creds, service)
+
+def _return_service(pool, creds, service):
+    try:
+        pool.put_nowait((creds, service))
+    except queue.Full:
+        pass
+
+# Gmail recommends keeping batches at or below 50 requests to avoid rate limiting
+DEFAULT_BATCH_SIZE = 50
+# messages.list returns at most 500 IDs per page
+MAX_PAGE_SIZE = 500
+
+# Only ask Gmail for the parts of a message we actually render
+MESSAGE_FIELDS = "id,threadId,labelIds,internalDate,payload(partId,mimeType,filename,headers,body,parts)"
+METADATA_HEADERS = ['From', 'Subject', 'Date', 'Message-ID', 'References']
+
+def _parse_message(msg_data, account=DEFAULT_ACCOUNT):
+    """Convert a Gmail API message resource into the email dict used by the app (bodies decode lazily)."""
+    message = ParsedMessage.from_resource(msg_data)
+    # Replies and attachment downloads go through the account the email came from
+    message['account'] = account
+    return message
+
+def _message_get_request(service, message_id, include_body=True):
+    """Build a messages().get request that only asks for the fields we render."""
+    messages = service.users().messages()
+    if include_body:
+        return messages.get(userId='me', id=message_id, format='full', fields=MESSAGE_FIELDS)
+    return messages.get(userId='me', id=message_id, format='metadata',
+                        metadataHeaders=METADATA_HEADERS, fields=MESSAGE_FIELDS)
+
+def fetch_messages(service, message_ids, batch_size=DEFAULT_BATCH_SIZE, include_body=True,
+                   account=DEFAULT_ACCOUNT):
+    """
+    Fetch many messages using Gmail HTTP batch requests of `batch_size` gets each.
+    Messages that fail inside a batch with a retryable status (e.g. a per-request 429)
+    are retried individually; messages deleted since they were listed (404) are skipped.
+    Returns the raw message resources in the same order as `message_ids`.
+    """
+    results = {}
+    failed = []
+
+    def callback(request_id, response, exception):
+        if exception is None:
+            results[request_id] = response
+        elif error_status(exception) == 404:
+            return
+        elif is_retryable(exception):
+            failed.append(request_id)
+        else:
+            raise exception
+
+    for start in range(0, len(message_ids), batch_size):
+        chunk = message_ids[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=callback)
+        for message_id in chunk:
+            batch.add(_message_get_request(service, message_id, include_body), request_id=message_id)
+        # Every get inside a batch is charged as a separate request
+        _execute(batch, "messages.batch_get", account, units=QUOTA_UNITS["messages.get"] * len(chunk))
+
+    for message_id in failed:
+        try:
+            results[message_id] = _execute(
+                _message_get_request(service, message_id, include_body), "messages.get", account, num_retries=3
+            )
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+
+    return [results[message_id] for message_id in message_ids if message_id in results]
+
+def iter_unread_emails(page_size=DEFAULT_BATCH_SIZE, max_results=None, service=None,
+                       batch_size=DEFAULT_BATCH_SIZE, include_body=True, account=DEFAULT_ACCOUNT,
+                       first_page_size=None):
+    """
+    Yield parsed unread inbox emails, following nextPageToken across all pages.
+    Each page is fetched with batched gets and its emails are yielded as soon as
+    the batch arrives, so callers can render results before the whole inbox is read.
+    `first_page_size`, when given, sizes only the first page so the first emails show
+    up quickly; later pages use `page_size`. Stops after `max_results` emails when given.
+    """
+    with gmail_service(account, service) as service:
+        page_token = None
+        yielded = 0
+
+        while max_results is None or yielded < max_results:
+            size = first_page_size if page_token is None and first_page_size else page_size
+            if max_results is not None:
+                size = min(size, max_results - yielded)
+            result = _execute(service.users().messages().list(
+                userId='me', labelIds=['INBOX'], q="is:unread",
+                maxResults=size, pageToken=page_token
+            ), "messages.list", account)
+            message_ids = [msg['id'] for msg in result.get('messages', [])]
+
+            for start in range(0, len(message_ids), batch_size):
+                chunk = message_ids[start:start + batch_size]
+                for msg_data in fetch_messages(service, chunk, batch_size=batch_size,
+                                               include_body=include_body, account=account):
+                    yield _parse_message(msg_data, account)
+                    yielded += 1
+
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+
+def get_unread_emails(service=None, batch_size=DEFAULT_BATCH_SIZE, include_body=True, max_results=None,
+                      account=DEFAULT_ACCOUNT):
+    return list(iter_unread_emails(
+        max_results=max_results, service=service, batch_size=batch_size, include_body=include_body,
+        account=account
+    ))
+
+def fetch_attachment(email, attachment, service=None):
+    """Return the bytes of one attachment of a parsed email, downloading it only if needed."""
+    data = email.attachment_data(attachment)
+    if data is not None:
+        return data
+    account = email.get('account', DEFAULT_ACCOUNT)
+    with gmail_service(account, service) as service:
+        result = _execute(service.users().messages().attachments().get(
+            userId='me', messageId=email['id'], id=attachment['attachment_id']
+        ), "attachments.get", account)
+        return decode_base64url(result['data'])
+
+def _apply_history(service, store, start_history_id, batch_size=DEFAULT_BATCH_SIZE, account=DEFAULT_ACCOUNT):
+    """
+    Replay Gmail history since `start_history_id` into `store`.
+    Label changes are applied in place and only newly relevant messages are fetched.
+    Raises HttpError(404) when the history ID has expired.
+    """
+    label_changes = {}
+    deleted = set()
+    page_token = None
+
+    while True:
+        result = _execute(service.users().history().list(
+            userId='me', startHistoryId=start_history_id, pageToken=page_token
+        ), "history.list", account)
+        for record in result.get('history', []):
+            # Records are chronological, so later label sets overwrite earlier ones
+            for change in (record.get('messagesAdded', []) + record.get('labelsAdded', [])
+                           + record.get('labelsRemoved', [])):
+                message = change['message']
+                label_changes[message['id']] = message.get('labelIds', [])
+            for change in record.get('messagesDeleted', []):
+                deleted.add(change['message']['id'])
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            break
+
+    known = {}
+    to_fetch = []
+    for message_id, label_ids in label_changes.items():
+        if message_id in deleted:
+            continue
+        if store.has_message(message_id):
+            known[message_id] = label_ids
+        elif 'UNREAD' in label_ids and 'INBOX' in label_ids:
+            to_fetch.append(message_id)
+
+    store.set_labels(known)
+    store.delete_messages(deleted)
+    if to_fetch:
+        fetched = fetch_messages(service, to_fetch, batch_size=batch_size, account=account)
+        store.upsert_messages([_parse_message(msg_data, account) for msg_data in fetched])
+    store.set_history_id(result['historyId'])
+
+def sync_unread_emails(store, service=None, page_size=DEFAULT_BATCH_SIZE, max_results=None,
+                       batch_size=DEFAULT_BATCH_SIZE, account=DEFAULT_ACCOUNT, first_page_size=None):
+    """
+    Yield unread inbox emails, keeping `store` (a message_store.MessageStore) in sync.
+    After the first load only Gmail history since the stored historyId is fetched;
+    a full resync happens when there is no stored historyId or it has expired.
+    Each account needs its own store.
+    """
+    with gmail_service(account, service) as service:
+        history_id = store.get_history_id()
+        if history_id:
+            try:
+                _apply_history(service, store, history_id, batch_size=batch_size, account=account)
+            except HttpError as e:
+                # Gmail returns 404 once the start history ID is too old to replay
+                if e.resp.status != 404:
+                    raise
+            else:
+                for email in store.unread_emails(limit=max_results):
+                    email['account'] = account
+                    yield email
+                return
+
+        # Read the history ID before listing so changes made during the resync are replayed next time
+        profile = _execute(service.users().getProfile(userId='me'), "getProfile", account)
+        store.clear()
+        pending = []
+        for email in iter_unread_emails(page_size=page_size, max_results=max_results, service=service,
+                                        batch_size=batch_size, account=account, first_page_size=first_page_size):
+            pending.append(email)
+            if len(pending) >= batch_size:
+                store.upsert_messages(pending)
+                pending = []
+            yield email
+        store.upsert_messages(pending)
+        store.set_history_id(profile['historyId'])
+
+def sync_accounts(stores, page_size=DEFAULT_BATCH_SIZE, max_results=None, batch_size=DEFAULT_BATCH_SIZE,
+                  services=None):
+    """
+    Sync several accounts at once; `stores` maps account name to its MessageStore
+    (and `services`, optionally, to a Gmail service). Each account syncs on its own
+    thread, so the wall-clock time is that of the slowest inbox rather than the sum.
+    Yields (account, emails, error) as each account finishes.
+    """
+    services = services or {}
+
+    def sync_one(account):
+        return list(sync_unread_emails(stores[account], service=services.get(account), page_size=page_size,
+                                       max_results=max_results, batch_size=batch_size, account=account))
+
+    if not stores:
+        return
+    with ThreadPoolExecutor(max_workers=len(stores)) as executor:
+        futures = {executor.submit(sync_one, account): account for account in stores}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], [], e
+
+def merge_inboxes(inboxes, max_results=None):
+    """Merge per-account email lists (each newest first) into one list ordered by date."""
+    merged = heapq.merge(*inboxes, key=lambda email: email.get('internal_date', 0), reverse=True)
+    return list(merged if max_results is None else itertools.islice(merged, max_results))
+
+def build_reply_message(to, subject, body, in_reply_to="", references=""):
+    """Build a MIME reply; In-Reply-To/References point at the original Message-ID."""
+    message = EmailMessage()
+    message['To'] = to
+    message['Subject'] = subject
+    if in_reply_to:
+        message['In-Reply-To'] = in_reply_to
+        message['References'] = f"{references} {in_reply_to}".strip()
+    message.set_content(body)
+    return base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
+
+def reply_subject(subject):
+    return subject if subject.lower().startswith("re:") else "Re: " + subject
+
+def send_email_reply(to, subject, body, thread_id, in_reply_to="", references="", service=None,
+                     account=DEFAULT_ACCOUNT):
+    with gmail_service(account, service) as service:
+        message = {
+            'raw': build_reply_message(to, subject, body, in_reply_to, references),
+            'threadId': thread_id
+        }
+        return _execute(service.users().messages().send(userId='me', body=message), "messages.send", account)
 
+def reply_to_email(email, body, service=None):
+    """Send `body` as a threaded reply to a parsed email dict, from the account it was received on."""
+    return send_email_reply(
+        to=email['sender'],
+        subject=reply_subject(email['subject']),
+        body=body,
+        thread_id=email['thread_id'],
+        in_reply_to=email.get('rfc_message_id', ""),
+        references=email.get('references', ""),
+        service=service,
+        account=email.get('account', DEFAULT_ACCOUNT)
+    )
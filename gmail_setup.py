@@ -1,8 +1,10 @@
 """
 Gmail API Setup Script
 Run this once to authenticate and generate credentials.json
+Extra mailboxes get a named profile:  python gmail_setup.py --account support
 """
 
+import argparse
 import os
 import pickle
 from google.auth.transport.requests import Request
@@ -10,15 +12,18 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+from gmail_api import account_path, DEFAULT_ACCOUNT
+
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
-def setup_gmail_auth():
+def setup_gmail_auth(account=DEFAULT_ACCOUNT):
     """Set up Gmail API authentication"""
     creds = None
+    token_path = account_path(account, 'token.pickle')
     
     # Check if we already have credentials
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
+    if os.path.exists(token_path):
+        with open(token_path, 'rb') as token:
             creds = pickle.load(token)
     
     # If there are no (valid) credentials available, let the user log in
@@ -50,19 +55,24 @@ def setup_gmail_auth():
             creds = flow.run_local_server(port=0)
         
         # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
+        os.makedirs(os.path.dirname(token_path) or '.', exist_ok=True)
+        with open(token_path, 'wb') as token:
             pickle.dump(creds, token)
         
         # Also save as credentials.json for your app
-        with open('credentials.json', 'w') as f:
+        with open(account_path(account, 'credentials.json'), 'w') as f:
             f.write(creds.to_json())
     
-    print("✅ Gmail API authentication successful!")
+    print(f"✅ Gmail API authentication successful for account '{account}'!")
     return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Authenticate a Gmail account for the assistant.")
+    parser.add_argument("--account", default=DEFAULT_ACCOUNT, help="profile name for an additional mailbox")
+    args = parser.parse_args()
+
     print("🔧 Setting up Gmail API authentication...")
-    success = setup_gmail_auth()
+    success = setup_gmail_auth(args.account)
     
     if success:
         print("\n🎉 Setup complete! You can now run your Streamlit app.")
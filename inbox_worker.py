@@ -0,0 +1,146 @@
+"""
+Headless inbox worker.
+Syncs unread Gmail messages into the local message store on a schedule and
+prepares reply drafts ahead of time, so the Streamlit app only has to read them.
+
+Run once:            python inbox_worker.py --once
+Poll every 5 min:    python inbox_worker.py --interval 300
+Export metrics:      python inbox_worker.py --metrics worker_metrics.prom
+Some accounts only:  python inbox_worker.py --account default --account support
+"""
+
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+from clustering import cluster_emails
+from gmail_api import (
+    sync_unread_emails,
+    list_accounts,
+    account_path,
+    DEFAULT_ACCOUNT,
+    load_knowledge_base,
+    search_knowledge_many,
+    DEFAULT_KB_PATH,
+    DEFAULT_TOP_K,
+    DEFAULT_RETRIEVAL_BACKEND,
+    RETRIEVAL_BACKENDS
+)
+from llm_cache import LLMCache
+from llm_engine import generate_drafts, new_client, new_rate_limiter
+from prompt_builder import draft_reply_prompt, kb_draft_prompt
+from message_store import MessageStore, DEFAULT_DB_PATH
+
+DEFAULT_INTERVAL = 300
+DEFAULT_MAX_EMAILS = 500
+
+# Knowledge base entries are sent one retrieval chunk at a time so drafting starts early
+RETRIEVAL_CHUNK = 16
+
+
+def _draft_jobs(emails, knowledge_base, kb_path, backend, sources):
+    """
+    Yield (message_id, messages) prompts for the drafting pool. Retrieval runs a
+    chunk at a time, so the pool is already drafting earlier emails meanwhile.
+    """
+    for start in range(0, len(emails), RETRIEVAL_CHUNK):
+        chunk = emails[start:start + RETRIEVAL_CHUNK]
+        if knowledge_base:
+            matches = search_knowledge_many(
+                [email['body'] for email in chunk], knowledge_base, DEFAULT_TOP_K, kb_path, backend
+            )
+        else:
+            matches = [[] for _ in chunk]
+
+        for email, relevant in zip(chunk, matches):
+            if relevant:
+                sources[email['id']] = "kb"
+                prompt = kb_draft_prompt(email['body'], [entry for entry, _ in relevant])
+            else:
+                sources[email['id']] = "plain"
+                prompt = draft_reply_prompt(email['body'])
+            yield email['id'], prompt['messages']
+
+
+def run_once(store, client, max_emails=DEFAULT_MAX_EMAILS, kb_path=DEFAULT_KB_PATH,
+             backend=DEFAULT_RETRIEVAL_BACKEND, max_workers=4, rate_limiter=None, cache=None,
+             account=DEFAULT_ACCOUNT):
+    """Sync an account's inbox into its store and draft replies for unread emails that don't have one yet."""
+    emails = list(sync_unread_emails(store, max_results=max_emails, account=account))
+    existing = store.get_drafts(email['id'] for email in emails)
+    pending = [email for email in emails if email['id'] not in existing]
+    print(f"📥 [{account}] {len(emails)} unread email(s), {len(pending)} need a draft")
+    if not pending or client is None:
+        return 0
+
+    # Near-duplicates share one retrieval and one LLM call; every member gets the draft
+    clusters = cluster_emails(pending)
+    members = {pending[cluster[0]]['id']: [pending[i]['id'] for i in cluster] for cluster in clusters}
+    representatives = [pending[cluster[0]] for cluster in clusters]
+
+    knowledge_base = load_knowledge_base(kb_path)
+    sources = {}
+    drafted = 0
+    jobs = _draft_jobs(representatives, knowledge_base, kb_path, backend, sources)
+    for message_id, draft, error in generate_drafts(
+        client, jobs, max_workers=max_workers, rate_limiter=rate_limiter, cache=cache
+    ):
+        if error is not None:
+            print(f"⚠️  Draft failed for {message_id}: {error}")
+            continue
+        for member_id in members[message_id]:
+            store.save_draft(member_id, draft, sources[message_id])
+            drafted += 1
+    print(f"✨ [{account}] Drafted {drafted}/{len(pending)} replies with {len(clusters)} LLM request(s)")
+    return drafted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the inbox and pre-draft replies in the background.")
+    parser.add_argument("--once", action="store_true", help="run a single sync and exit")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="seconds between syncs")
+    parser.add_argument("--max-emails", type=int, default=DEFAULT_MAX_EMAILS)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent LLM requests")
+    parser.add_argument("--kb", default=DEFAULT_KB_PATH, help="knowledge base JSON path")
+    parser.add_argument("--backend", choices=RETRIEVAL_BACKENDS, default=DEFAULT_RETRIEVAL_BACKEND)
+    parser.add_argument("--no-drafts", action="store_true", help="only sync, don't call the LLM")
+    parser.add_argument("--account", action="append", dest="accounts",
+                        help="account profile to watch (repeatable; default: every configured account)")
+    parser.add_argument("--metrics", help="write call metrics here after every sync (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.environ.get("GROQ_API_KEY")
+    client = None
+    if not args.no_drafts:
+        if not api_key:
+            parser.error("Set GROQ_API_KEY (or pass --no-drafts) to generate drafts.")
+        client = new_client(api_key)
+
+    accounts = args.accounts or list_accounts() or [DEFAULT_ACCOUNT]
+    stores = {account: MessageStore(account_path(account, DEFAULT_DB_PATH)) for account in accounts}
+    cache = LLMCache()
+    # One Groq limiter for all accounts: they share the API key
+    rate_limiter = new_rate_limiter()
+
+    while True:
+        started = time.monotonic()
+        for account, store in stores.items():
+            try:
+                run_once(store, client, args.max_emails, args.kb, args.backend, args.workers, rate_limiter, cache,
+                         account=account)
+            except Exception as e:
+                # Keep polling through transient Gmail/LLM failures
+                print(f"❌ [{account}] Sync failed: {e}")
+        if args.metrics:
+            metrics.write_dump(args.metrics)
+        if args.once:
+            break
+        time.sleep(max(0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Semantic search backend for the knowledge base.
+Entries are embedded once and stored as a memory-mapped NumPy matrix next to
+the knowledge base; lookups are a single vectorized matrix product.
+Uses a local CPU sentence-transformers model when installed, otherwise a
+hashed character n-gram embedding. Entries below a minimum cosine similarity
+are not returned, so emails unrelated to the knowledge base get no context.
+"""
+
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from kb_index import STOPWORDS
+from kb_store import entry_hash
+
+LOCAL_MODEL_NAME = "all-MiniLM-L6-v2"
+HASHING_DIM = 512
+
+# Minimum cosine similarity for an entry to count as relevant. Hashed n-grams give
+# unrelated texts a higher baseline than a sentence model does, so each has its own default.
+HASHING_MIN_SIMILARITY = 0.2
+LOCAL_MODEL_MIN_SIMILARITY = 0.3
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedder:
+    """Dependency-free embedding: signed feature hashing of words and character n-grams."""
+
+    def __init__(self, dim=HASHING_DIM, ngram_range=(3, 5), min_similarity=HASHING_MIN_SIMILARITY):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.min_similarity = min_similarity
+        self.name = f"hashing-{dim}-{ngram_range[0]}-{ngram_range[1]}-nostop"
+
+    def _features(self, text):
+        words = WORD_RE.findall(text.lower())
+        for word in words:
+            # Stopwords and greetings would make every pair of emails look alike
+            if len(word) < 2 or word in STOPWORDS:
+                continue
+            yield word
+            padded = f"<{word}>"
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for i in range(len(padded) - n + 1):
+                    yield padded[i:i + n]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode('utf-8'))
+                # The top bit picks the sign so collisions tend to cancel out
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence-transformers model."""
+
+    def __init__(self, model_name=LOCAL_MODEL_NAME, min_similarity=LOCAL_MODEL_MIN_SIMILARITY):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.min_similarity = min_similarity
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts):
+        vectors = self._model.encode(list(texts), batch_size=64, convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def default_embedder():
+    """Use the local model when sentence-transformers is available, else hashed n-grams."""
+    try:
+        return SentenceTransformerEmbedder()
+    except Exception:
+        return HashingEmbedder()
+
+
+def entry_text(entry):
+    return f"{entry.get('question', '')}\n{entry.get('answer', '')}"
+
+
+def vectors_path_for(kb_path):
+    return os.path.splitext(kb_path)[0] + ".vectors.npy"
+
+
+class EmbeddingIndex:
+    """Row `i` of the memory-mapped matrix is the embedding of knowledge-base entry `i`."""
+
+    def __init__(self, path, embedder):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        self.embedder = embedder
+        self.hashes = []
+        self.matrix = np.zeros((0, embedder.dim), dtype=np.float32)
+        # The knowledge-base list last synced; the store hands out the same list until
+        # entries are added, so unchanged lists aren't hashed again on every query
+        self._synced = None
+
+    def _load(self):
+        if not (os.path.exists(self.path) and os.path.exists(self.meta_path)):
+            return False
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['embedder'] != self.embedder.name:
+                return False
+            matrix = np.load(self.path, mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return False
+        if matrix.shape != (len(meta['hashes']), self.embedder.dim):
+            return False
+        self.hashes = meta['hashes']
+        self.matrix = matrix
+        return True
+
+    def sync(self, knowledge_base):
+        """
+        Bring the stored vectors in line with `knowledge_base`, embedding only changed entries.
+        Entries are only re-hashed when a different or longer list comes in.
+        """
+        if knowledge_base is self._synced and len(knowledge_base) == len(self.hashes):
+            return self
+        if not self.hashes:
+            self._load()
+
+        hashes = [entry_hash(entry) for entry in knowledge_base]
+        if hashes == self.hashes:
+            self._synced = knowledge_base
+            return self
+
+        previous = {h: row for row, h in enumerate(self.hashes)}
+        changed = [i for i, h in enumerate(hashes) if h not in previous]
+
+        tmp_path = self.path + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float32, shape=(len(hashes), self.embedder.dim)
+        )
+        for i, h in enumerate(hashes):
+            if h in previous:
+                matrix[i] = self.matrix[previous[h]]
+        if changed:
+            matrix[changed] = self.embedder.embed([entry_text(knowledge_base[i]) for i in changed])
+        matrix.flush()
+        del matrix
+
+        os.replace(tmp_path, self.path)
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"embedder": self.embedder.name, "hashes": hashes}, f)
+        self.hashes = hashes
+        self.matrix = np.load(self.path, mmap_mode='r')
+        self._synced = knowledge_base
+        return self
+
+    def search_many(self, texts, top_k=5, min_similarity=None):
+        """
+        Rank entries for many query texts with one matrix multiply. Entries below
+        `min_similarity` (default: the embedder's) are left out, so an unrelated email gets [].
+        """
+        if min_similarity is None:
+            min_similarity = self.embedder.min_similarity
+        if not len(self.hashes) or not texts:
+            return [[] for _ in texts]
+        scores = self.embedder.embed(texts) @ self.matrix.T
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ranked = candidates[np.argsort(-scores[row, candidates])]
+            results.append([(int(i), float(scores[row, i])) for i in ranked if scores[row, i] >= min_similarity])
+        return results
+
+    def search(self, text, top_k=5, min_similarity=None):
+        return self.search_many([text], top_k, min_similarity)[0]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_embedding_index(knowledge_base, path, embedder=None):
+    """Return the in-process embedding index for `path`, synced to `knowledge_base`."""
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = EmbeddingIndex(path, embedder or default_embedder())
+            _indexes[path] = index
+        return index.sync(knowledge_base)
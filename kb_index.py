@@ -0,0 +1,173 @@
+"""
+Inverted index with BM25 ranking over knowledge-base questions and answers.
+The index is persisted next to the knowledge base as an append-only JSON-lines
+file (one line per entry), so new entries are indexed and saved incrementally
+instead of rebuilding the index on every request.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from kb_store import entry_hash
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you
+your yours yourself yourselves hi hello dear thanks thank regards please
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Question terms describe what an entry is about, so they count more than answer terms
+QUESTION_WEIGHT = 2
+
+
+def tokenize(text):
+    """Lowercase, split into word tokens and drop stopwords and single characters."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def index_path_for(kb_path):
+    return os.path.splitext(kb_path)[0] + ".index.jsonl"
+
+
+class KnowledgeIndex:
+    """BM25 index; document IDs are positions in the knowledge-base list."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.hashes = []
+        self.doc_lengths = []
+        self.postings = {}
+        self.total_length = 0
+        # Documents indexed since the last save, as (content hash, term counts)
+        self._pending = []
+        # The knowledge-base list last checked against the index; the store hands out the
+        # same list until entries are added, so unchanged lists skip the per-entry check
+        self._synced = None
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _add_document(self, content_hash, terms):
+        doc_id = len(self.hashes)
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(terms.values())
+        self.hashes.append(content_hash)
+        self.doc_lengths.append(length)
+        self.total_length += length
+
+    def add(self, entries):
+        """Append entries to the index; their document IDs continue from the current size."""
+        for entry in entries:
+            terms = Counter(tokenize(entry.get('question', '')) * QUESTION_WEIGHT)
+            terms.update(tokenize(entry.get('answer', '')))
+            self._add_document(entry_hash(entry), terms)
+            self._pending.append((self.hashes[-1], terms))
+
+    def is_synced(self, knowledge_base):
+        """True if `knowledge_base` is the list last synced and still the same size (entries are append-only)."""
+        return knowledge_base is self._synced and len(knowledge_base) == len(self.hashes)
+
+    def matches(self, knowledge_base):
+        """Number of leading entries of `knowledge_base` already indexed unchanged, or -1 if they diverge."""
+        if len(knowledge_base) < len(self.hashes):
+            return -1
+        for doc_id, content_hash in enumerate(self.hashes):
+            # Content hashes, so an edited answer is re-indexed too
+            if entry_hash(knowledge_base[doc_id]) != content_hash:
+                return -1
+        return len(self.hashes)
+
+    def search(self, text, top_k=5):
+        """Return up to `top_k` (doc_id, score) pairs, best first."""
+        if not self.hashes:
+            return []
+        n_docs = len(self.hashes)
+        avg_length = self.total_length / n_docs or 1.0
+        scores = {}
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def save(self, path, rewrite=False):
+        """
+        Persist documents indexed since the last save by appending them to `path`.
+        With `rewrite` (or when the file is missing) the file is replaced atomically.
+        """
+        lines = [json.dumps({"hash": content_hash, "terms": terms}, ensure_ascii=False) + "\n"
+                 for content_hash, terms in self._pending]
+        if rewrite or not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"k1": self.k1, "b": self.b}) + "\n")
+                f.writelines(lines)
+            os.replace(tmp_path, path)
+        elif lines:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+        self._pending = []
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            index = cls(header['k1'], header['b'])
+            for line in f:
+                doc = json.loads(line)
+                index._add_document(doc['hash'], doc['terms'])
+        return index
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(knowledge_base, path):
+    """
+    Return an index covering `knowledge_base`, reusing the in-process or on-disk copy.
+    Newly appended entries are indexed incrementally; anything else triggers a rebuild.
+    Entries are only compared (by content hash) when a different or longer list comes in,
+    not on every search.
+    """
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is not None and index.is_synced(knowledge_base):
+            return index
+        if index is None and os.path.exists(path):
+            try:
+                index = KnowledgeIndex.load(path)
+            except (OSError, ValueError, KeyError):
+                index = None
+
+        indexed = index.matches(knowledge_base) if index is not None else -1
+        if indexed == len(knowledge_base):
+            index._synced = knowledge_base
+            _indexes[path] = index
+            return index
+
+        rebuild = indexed < 0
+        if rebuild:
+            index = KnowledgeIndex()
+            indexed = 0
+        index.add(knowledge_base[indexed:])
+        index.save(path, rewrite=rebuild)
+        index._synced = knowledge_base
+        _indexes[path] = index
+        return index
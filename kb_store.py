@@ -0,0 +1,210 @@
+"""
+SQLite-backed knowledge base storage.
+Uploads insert only the new entries inside one atomic transaction, and reads
+are served from an in-process copy until the database file changes on disk.
+The JSON knowledge base is still supported for import and export: whenever the
+JSON file changes it is merged back in, so hand edits to answers and removed
+entries show up in the store (and in the search indexes).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# How long a writer waits for another session's transaction before giving up
+LOCK_TIMEOUT = 30
+
+
+def entry_key(entry):
+    """Entries are deduplicated on their case-insensitive question."""
+    return entry.get('question', '').lower().strip()
+
+
+def entry_hash(entry):
+    """Fingerprint of an entry's content; changes when its question or answer is edited."""
+    return hashlib.sha1(f"{entry.get('question', '')}\n{entry.get('answer', '')}".encode('utf-8')).hexdigest()
+
+
+def db_path_for(json_path):
+    return os.path.splitext(json_path)[0] + ".db"
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class KnowledgeStore:
+    """Knowledge base entries in insertion order, backed by `<name>.db` next to the JSON file."""
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.path = db_path_for(json_path)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._last_id = 0
+        self._generation = None
+        self._signature = None
+        self._json_signature = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._import_json_if_changed()
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection per operation, committed on success; safe across threads and processes."""
+        conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    @staticmethod
+    def _get_meta(conn, key, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _import_json_if_changed(self):
+        """
+        Merge the JSON knowledge base into the store when it was edited since the last import.
+        Edited entries are updated in place, and entries removed from the file since the
+        last import are deleted; entries uploaded but never exported are kept.
+        """
+        signature = _file_signature(self.json_path)
+        if signature is None or signature == self._json_signature:
+            return
+        with self._connect() as conn:
+            stored = self._get_meta(conn, 'json_signature')
+        if stored != list(signature):
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            self._import_entries(entries, signature)
+        self._json_signature = signature
+
+    def _import_entries(self, entries, json_signature):
+        rows = {
+            entry_key(entry): json.dumps(entry, ensure_ascii=False)
+            for entry in entries if entry.get('question')
+        }
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            previous_keys = set(self._get_meta(conn, 'json_keys', []))
+            count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            before = conn.total_changes
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in previous_keys - rows.keys()])
+            conn.executemany(
+                "INSERT INTO entries (key, data) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data WHERE data != excluded.data",
+                rows.items()
+            )
+            added = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - count
+            # Non-zero when rows were deleted or updated rather than only appended
+            rewritten = conn.total_changes - before - added
+            if rewritten:
+                # Not an append: readers must reload everything rather than only the new rows
+                self._set_meta(conn, 'generation', self._get_meta(conn, 'generation', 0) + 1)
+            self._set_meta(conn, 'json_keys', sorted(rows))
+            self._set_meta(conn, 'json_signature', list(json_signature))
+
+    def add_entries(self, new_entries):
+        """Insert entries whose question is not stored yet; returns how many were added."""
+        rows = [
+            (entry_key(entry), json.dumps(entry, ensure_ascii=False))
+            for entry in new_entries if entry.get('question')
+        ]
+        with self._connect() as conn:
+            # Take the write lock up front so concurrent uploads serialize instead of failing mid-way
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO entries (key, data) VALUES (?, ?)", rows)
+            added = conn.total_changes - before
+        return added
+
+    def entries(self):
+        """
+        All entries in insertion order. The JSON file is re-imported when it changed; the
+        database is only read when its file changed, and then only rows added since the
+        last read unless entries were edited or removed.
+        """
+        self._import_json_if_changed()
+        with self._lock:
+            signature = _file_signature(self.path)
+            if self._entries is not None and signature == self._signature:
+                return self._entries
+            with self._connect() as conn:
+                generation = self._get_meta(conn, 'generation', 0)
+                if generation != self._generation:
+                    self._entries, self._last_id = None, 0
+                rows = conn.execute(
+                    "SELECT id, data FROM entries WHERE id > ? ORDER BY id", (self._last_id,)
+                ).fetchall()
+                count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            entries = (self._entries or []) + [json.loads(data) for _, data in rows]
+            if len(entries) != count:
+                # Rows were removed or the database was replaced underneath us; start over
+                with self._connect() as conn:
+                    rows = conn.execute("SELECT id, data FROM entries ORDER BY id").fetchall()
+                entries = [json.loads(data) for _, data in rows]
+            if rows:
+                self._last_id = rows[-1][0]
+            self._entries = entries
+            self._generation = generation
+            self._signature = signature
+            return entries
+
+    def export_json(self, path=None):
+        """
+        Write the whole knowledge base as a JSON list (defaults to the source JSON file).
+        Pending edits to the JSON file are imported first, so exporting never overwrites them.
+        """
+        path = path or self.json_path
+        entries = self.entries()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        if path == self.json_path:
+            # The export already matches the store, so don't re-import it; every entry is now in the file
+            signature = _file_signature(path)
+            with self._connect() as conn:
+                self._set_meta(conn, 'json_keys', sorted(entry_key(entry) for entry in entries))
+                self._set_meta(conn, 'json_signature', list(signature))
+            self._json_signature = signature
+        return path
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(json_path):
+    """Process-wide store for a knowledge base path."""
+    with _stores_lock:
+        store = _stores.get(json_path)
+        if store is None:
+            store = KnowledgeStore(json_path)
+            _stores[json_path] = store
+        return store
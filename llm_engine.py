@@ -0,0 +1,231 @@
+"""
+LLM helpers for summarizing and drafting email replies.
+Wraps chat.completions.create with timeouts, retries and client-side rate
+limiting, runs bulk drafting on a bounded thread pool, summarizes many emails
+per request, and streams single completions token by token.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from groq import Groq
+
+import metrics
+from llm_cache import cache_key
+from prompt_builder import count_tokens, batch_summary_prompts, summary_prompt, RESERVED_COMPLETION_TOKENS
+from rate_limit import RateLimiter, call_with_retry
+
+DEFAULT_MODEL = "llama3-70b-8192"
+DEFAULT_TIMEOUT = 60
+DEFAULT_MAX_WORKERS = 4
+
+# Defaults follow Groq's published limits for llama3-70b; adjust to match your plan
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 30000
+
+# Rough allowance for the completion when budgeting tokens for the rate limiter
+COMPLETION_TOKEN_ESTIMATE = 400
+
+
+def estimate_tokens(messages):
+    """Token estimate for the rate limiter: the prompt plus an allowance for the completion."""
+    return sum(count_tokens(m['content']) for m in messages) + COMPLETION_TOKEN_ESTIMATE
+
+
+def new_client(api_key):
+    """
+    Groq client with the SDK's own retries turned off: they would bypass the rate
+    limiter and multiply the attempts made by call_with_retry here.
+    """
+    return Groq(api_key=api_key, max_retries=0)
+
+
+def new_rate_limiter():
+    return RateLimiter(DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, name="llm.completion")
+
+
+def _record_usage(op, usage, messages, text):
+    """Count tokens from the response's usage block, or estimate them when there is none."""
+    if getattr(usage, 'prompt_tokens', None) is not None:
+        metrics.add(op, prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens or 0)
+    else:
+        metrics.add(op, prompt_tokens=sum(count_tokens(m['content']) for m in messages),
+                    completion_tokens=count_tokens(text or ""))
+
+
+def chat_completion(client, messages, model=DEFAULT_MODEL, timeout=DEFAULT_TIMEOUT,
+                    max_retries=3, rate_limiter=None, cache=None, response_format=None, refresh=False):
+    """
+    Run one chat completion and return the reply text.
+    Retries 429/5xx responses and timeouts with exponential backoff.
+    When `cache` (an llm_cache.LLMCache) is given, identical prompts are served from it;
+    `refresh=True` asks the model again (e.g. for a different draft) and caches the new reply.
+    `response_format` is passed through, e.g. {"type": "json_object"} for JSON mode.
+    """
+    key = cache_key(model, messages) if cache is not None else None
+    if key is not None and not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    def attempt():
+        if rate_limiter is not None:
+            rate_limiter.acquire(estimate_tokens(messages))
+        extra = {"response_format": response_format} if response_format else {}
+        with metrics.timer("llm.completion"):
+            response = client.chat.completions.create(
+                model=model, messages=messages, timeout=timeout, max_tokens=RESERVED_COMPLETION_TOKENS, **extra
+            )
+        content = response.choices[0].message.content
+        _record_usage("llm.completion", getattr(response, 'usage', None), messages, content)
+        return content
+
+    content = call_with_retry(attempt, max_retries=max_retries, name="llm.completion")
+    if key is not None and content:
+        cache.put(key, content)
+    return content
+
+
+def generate_drafts(client, jobs, max_workers=DEFAULT_MAX_WORKERS, rate_limiter=None, cache=None, **kwargs):
+    """
+    Run many completions concurrently on a bounded thread pool.
+    `jobs` maps a caller-chosen key to a messages list, or is an iterable of
+    (key, messages) pairs; requests start as soon as each pair is produced, so a
+    lazy iterable overlaps prompt preparation with drafting. Yields (key, text, error)
+    tuples as each request finishes; exactly one of text/error is None.
+    """
+    if isinstance(jobs, dict):
+        jobs = jobs.items()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(chat_completion, client, messages, rate_limiter=rate_limiter, cache=cache, **kwargs): key
+            for key, messages in jobs
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result(), None
+            except Exception as e:
+                yield key, None, e
+    finally:
+        # Don't start queued requests if the caller stops consuming results early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_batch_summaries(text, ids):
+    """Return {id: summary} from a batch reply; ids that are missing or not text are left out."""
+    if not text:
+        return {}
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # Tolerate prose or a code fence around the object
+        start, end = text.find('{'), text.rfind('}')
+        try:
+            data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        return {}
+    return {
+        message_id: data[message_id].strip()
+        for message_id in ids
+        if isinstance(data.get(message_id), str) and data[message_id].strip()
+    }
+
+
+def summarize_many(client, emails, max_workers=DEFAULT_MAX_WORKERS, rate_limiter=None, cache=None,
+                   stats=None, **kwargs):
+    """
+    Summarize emails (dicts with 'id' and 'body') with as few requests as possible.
+    Emails are packed into JSON-mode batch prompts that run concurrently; any email
+    whose summary is missing from its batch reply falls back to a single-email
+    request. Yields (message_id, summary, error) like generate_drafts.
+    `stats`, if given, receives the number of batch requests and fallbacks.
+    """
+    stats = stats if stats is not None else {}
+    bodies = {email['id']: email['body'] for email in emails}
+    prompts = batch_summary_prompts(emails)
+    stats.update(requests=len(prompts), fallbacks=0)
+
+    fallback = {}
+    for n, text, error in generate_drafts(
+        client, {n: prompt['messages'] for n, prompt in enumerate(prompts)},
+        max_workers=max_workers, rate_limiter=rate_limiter, cache=cache,
+        response_format={"type": "json_object"}, **kwargs
+    ):
+        ids = prompts[n]['ids']
+        summaries = parse_batch_summaries(text, ids) if error is None else {}
+        for message_id in ids:
+            if message_id in summaries:
+                yield message_id, summaries[message_id], None
+            else:
+                fallback[message_id] = summary_prompt(bodies[message_id])['messages']
+
+    stats['fallbacks'] = len(fallback)
+    stats['requests'] += len(fallback)
+    yield from generate_drafts(
+        client, fallback, max_workers=max_workers, rate_limiter=rate_limiter, cache=cache, **kwargs
+    )
+
+
+def stream_completion(client, messages, model=DEFAULT_MODEL, timeout=DEFAULT_TIMEOUT,
+                      max_retries=3, rate_limiter=None, cache=None, stats=None, refresh=False):
+    """
+    Stream a chat completion, yielding text chunks as they arrive.
+    Cached prompts are yielded in one piece unless `refresh` is set, which streams a
+    new completion and caches that instead. Retries only cover opening the stream.
+    The full text is cached only if the stream runs to completion; closing the
+    generator early (e.g. the user pressed Stop) closes the HTTP stream.
+    `stats`, if given, receives first_token_seconds, total_seconds and cached.
+    """
+    stats = stats if stats is not None else {}
+    started = time.monotonic()
+    key = cache_key(model, messages) if cache is not None else None
+    if key is not None and not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            stats.update(cached=True, first_token_seconds=time.monotonic() - started,
+                         total_seconds=time.monotonic() - started)
+            yield cached
+            return
+
+    def open_stream():
+        if rate_limiter is not None:
+            rate_limiter.acquire(estimate_tokens(messages))
+        with metrics.timer("llm.stream_open"):
+            return client.chat.completions.create(
+                model=model, messages=messages, timeout=timeout,
+                max_tokens=RESERVED_COMPLETION_TOKENS, stream=True
+            )
+
+    stream = call_with_retry(open_stream, max_retries=max_retries, name="llm.stream")
+    stats['cached'] = False
+    parts = []
+    usage = None
+    try:
+        for chunk in stream:
+            # Groq reports usage on the last chunk
+            usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    stats['first_token_seconds'] = time.monotonic() - started
+                    metrics.observe("llm.first_token", stats['first_token_seconds'])
+                parts.append(delta)
+                yield delta
+    finally:
+        stats['total_seconds'] = time.monotonic() - started
+        metrics.observe("llm.stream", stats['total_seconds'])
+        _record_usage("llm.stream", usage, messages, "".join(parts))
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+
+    content = "".join(parts)
+    if key is not None and content:
+        cache.put(key, content)
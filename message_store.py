@@ -0,0 +1,147 @@
+"""
+Local message cache backed by SQLite.
+Stores parsed emails keyed by Gmail message ID together with the last synced
+historyId, so inbox refreshes only need to fetch what changed, plus reply
+drafts prepared ahead of time by the background worker.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from mime_parser import ParsedMessage
+
+DEFAULT_DB_PATH = "message_cache.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    internal_date INTEGER NOT NULL DEFAULT 0,
+    label_ids TEXT NOT NULL DEFAULT '[]',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (internal_date DESC);
+CREATE TABLE IF NOT EXISTS drafts (
+    message_id TEXT PRIMARY KEY,
+    draft TEXT NOT NULL,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class MessageStore:
+    """Persistent store of parsed emails and Gmail sync state."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # The background worker and the Streamlit app may share this file, so wait on locks
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_history_id(self):
+        """Return the historyId of the last successful sync, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = 'history_id'").fetchone()
+        return row[0] if row else None
+
+    def set_history_id(self, history_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('history_id', ?)",
+                (str(history_id),)
+            )
+
+    def has_message(self, message_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM messages WHERE id = ?", (message_id,)).fetchone()
+        return row is not None
+
+    def upsert_messages(self, emails):
+        """Insert or replace parsed email dicts (as returned by gmail_api)."""
+        rows = [
+            (
+                email['id'],
+                email['thread_id'],
+                int(email.get('internal_date') or 0),
+                json.dumps(email.get('label_ids', [])),
+                # Parsed messages keep their raw payload so bodies are still decoded lazily
+                json.dumps(email.to_dict() if isinstance(email, ParsedMessage) else email, ensure_ascii=False),
+            )
+            for email in emails
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages (id, thread_id, internal_date, label_ids, data) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def set_labels(self, label_changes):
+        """Apply {message_id: label_ids} in place for messages already in the store."""
+        with self._lock, self._conn:
+            for message_id, label_ids in label_changes.items():
+                self._conn.execute(
+                    "UPDATE messages SET label_ids = ? WHERE id = ?",
+                    (json.dumps(label_ids), message_id)
+                )
+
+    def delete_messages(self, message_ids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(m,) for m in message_ids])
+
+    def save_draft(self, message_id, draft, source):
+        """Store a ready reply draft for a message; `source` is "kb" or "plain"."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drafts (message_id, draft, source, created_at) VALUES (?, ?, ?, ?)",
+                (message_id, draft, source, time.time())
+            )
+
+    def get_drafts(self, message_ids):
+        """Return {message_id: draft} for the given messages that have a stored draft."""
+        message_ids = list(message_ids)
+        drafts = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                drafts.update(self._conn.execute(
+                    f"SELECT message_id, draft FROM drafts WHERE message_id IN ({placeholders})", chunk
+                ).fetchall())
+        return drafts
+
+    def clear(self):
+        """Drop every cached message and the sync state (used before a full resync)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM sync_state")
+
+    def unread_emails(self, label_id='INBOX', limit=None):
+        """Return cached unread emails carrying `label_id`, newest first."""
+        query = "SELECT data, label_ids FROM messages ORDER BY internal_date DESC"
+        with self._lock:
+            rows = self._conn.execute(query).fetchall()
+
+        emails = []
+        for data, label_ids in rows:
+            labels = json.loads(label_ids)
+            if 'UNREAD' in labels and label_id in labels:
+                email = ParsedMessage.from_dict(json.loads(data))
+                email['label_ids'] = labels
+                emails.append(email)
+                if limit is not None and len(emails) >= limit:
+                    break
+        return emails
@@ -0,0 +1,174 @@
+"""
+Lightweight in-process instrumentation.
+Records per-operation latency histograms, call and error counts, bytes
+transferred, LLM tokens, retries, API quota units and time spent waiting on
+rate limiters.
+Operations are named like "gmail.messages.list" or "llm.completion".
+Snapshots are available as a dict, JSON or Prometheus text exposition format.
+"""
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds (the last bucket catches everything else)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+PROMETHEUS_PREFIX = "email_assistant"
+
+COUNTERS = (
+    "bytes_sent", "bytes_received", "prompt_tokens", "completion_tokens", "retries", "throttled_seconds",
+    "quota_units",
+)
+
+
+class OpStats:
+    """Counters and latency histogram for one operation."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+
+    def observe(self, seconds, error=False):
+        self.calls += 1
+        self.errors += error
+        self.seconds += seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile, or None without observations."""
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+    def to_dict(self):
+        data = {
+            "calls": self.calls,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "mean_seconds": self.seconds / self.calls if self.calls else None,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "buckets": {str(bound): count for bound, count in zip(BUCKETS, self.buckets)},
+        }
+        data.update({counter: getattr(self, counter) for counter in COUNTERS})
+        return data
+
+
+_lock = threading.Lock()
+_ops = {}
+
+
+def _op(name):
+    stats = _ops.get(name)
+    if stats is None:
+        stats = _ops[name] = OpStats()
+    return stats
+
+
+def observe(name, seconds, error=False):
+    with _lock:
+        _op(name).observe(seconds, error)
+
+
+def add(name, **counts):
+    """Increment counters of `name`, e.g. add("llm.completion", prompt_tokens=812)."""
+    with _lock:
+        stats = _op(name)
+        for counter, value in counts.items():
+            setattr(stats, counter, getattr(stats, counter) + value)
+
+
+@contextmanager
+def timer(name):
+    """Time the block as one call of `name`; exceptions count as errors and propagate."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(name, time.perf_counter() - started, error)
+
+
+def instrumented(name):
+    """Decorator form of timer()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _ops.clear()
+
+
+def snapshot():
+    """{operation: stats dict}, sorted by operation name."""
+    with _lock:
+        return {name: _ops[name].to_dict() for name in sorted(_ops)}
+
+
+def to_json(indent=2):
+    return json.dumps({"timestamp": time.time(), "operations": snapshot()}, indent=indent)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def to_prometheus():
+    """Prometheus text exposition format, one labelled series per operation."""
+    ops = snapshot()
+    prefix = PROMETHEUS_PREFIX
+    lines = [
+        f"# HELP {prefix}_call_duration_seconds Latency of instrumented calls.",
+        f"# TYPE {prefix}_call_duration_seconds histogram",
+    ]
+    for name, stats in ops.items():
+        if not stats["calls"]:
+            continue
+        cumulative = 0
+        for bound, count in stats["buckets"].items():
+            cumulative += count
+            le = "+Inf" if bound == "inf" else bound
+            lines.append(f'{prefix}_call_duration_seconds_bucket{{op="{_label(name)}",le="{le}"}} {cumulative}')
+        lines.append(f'{prefix}_call_duration_seconds_sum{{op="{_label(name)}"}} {stats["seconds"]}')
+        lines.append(f'{prefix}_call_duration_seconds_count{{op="{_label(name)}"}} {stats["calls"]}')
+
+    for counter in ("errors",) + COUNTERS:
+        metric = f"{prefix}_{counter}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for name, stats in ops.items():
+            lines.append(f'{metric}{{op="{_label(name)}"}} {stats[counter]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_dump(path):
+    """Write a snapshot to `path`: Prometheus text for .prom/.txt files, JSON otherwise."""
+    text = to_prometheus() if path.endswith((".prom", ".txt")) else to_json()
+    # Write then rename so a scraper never reads a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,212 @@
+"""
+MIME parsing for Gmail API message resources.
+Walks nested multipart trees once to index the text, HTML and attachment
+parts, but only base64-decodes a body when it is first read. Attachments are
+listed by metadata and downloaded on demand.
+"""
+
+import base64
+import re
+from email.message import Message
+from html import unescape
+from html.parser import HTMLParser
+
+
+def decode_base64url(data):
+    # Gmail strips base64 padding in some responses
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _header_dict(headers):
+    """Headers as {lowercase name: value}, keeping the first occurrence like the old next(...) scans."""
+    parsed = {}
+    for header in headers or []:
+        parsed.setdefault(header['name'].lower(), header['value'])
+    return parsed
+
+
+def _charset(part_headers):
+    content_type = part_headers.get('content-type')
+    if not content_type:
+        return 'utf-8'
+    message = Message()
+    message['Content-Type'] = content_type
+    return message.get_content_charset() or 'utf-8'
+
+
+def _decode_text(part):
+    data = part.get('body', {}).get('data')
+    if not data:
+        return ''
+    raw = decode_base64url(data)
+    charset = _charset(_header_dict(part.get('headers')))
+    try:
+        return raw.decode(charset, errors='replace')
+    except LookupError:
+        # Unknown charset label; fall back rather than losing the body
+        return raw.decode('utf-8', errors='replace')
+
+
+def walk_parts(payload):
+    """
+    Recursively classify the parts of a payload.
+    Returns (first text/plain part, first text/html part, attachment metadata list).
+    """
+    text_part = None
+    html_part = None
+    attachments = []
+
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            # Reverse so parts are visited in document order
+            stack.extend(reversed(children))
+            continue
+
+        mime_type = part.get('mimeType', '').lower()
+        body = part.get('body', {})
+        headers = _header_dict(part.get('headers'))
+        disposition = headers.get('content-disposition', '').lower()
+
+        if part.get('filename') or body.get('attachmentId') or disposition.startswith('attachment'):
+            attachments.append({
+                "part_id": part.get('partId', ''),
+                "filename": part.get('filename') or 'attachment',
+                "mime_type": mime_type,
+                "size": body.get('size', 0),
+                "attachment_id": body.get('attachmentId'),
+                "data": body.get('data'),
+            })
+        elif mime_type == 'text/plain' and text_part is None:
+            text_part = part
+        elif mime_type == 'text/html' and html_part is None:
+            html_part = part
+        elif not mime_type and text_part is None:
+            # Older payloads without a mimeType: treat the body as plain text
+            text_part = part
+
+    return text_part, html_part, attachments
+
+
+class _HTMLToText(HTMLParser):
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'blockquote'}
+    SKIP_TAGS = {'script', 'style', 'head', 'title'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in self.BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.chunks.append(data)
+
+
+def html_to_text(html):
+    parser = _HTMLToText()
+    parser.feed(html)
+    parser.close()
+    text = unescape(''.join(parser.chunks))
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+    return re.sub(r'\n\s*\n\s*', '\n\n', text).strip()
+
+
+class ParsedMessage(dict):
+    """
+    Email dict as used by the app (sender, subject, date, thread_id, ...).
+    'body' (plain text, falling back to HTML converted to text) and 'html' are
+    decoded on first access and then kept.
+    """
+
+    LAZY_KEYS = ('body', 'html')
+
+    def __init__(self, fields, payload):
+        super().__init__(fields)
+        self.payload = payload
+        self._parts = None
+
+    @classmethod
+    def from_resource(cls, msg_data):
+        """Build from a Gmail API message resource; headers are parsed once into a dict."""
+        payload = msg_data.get('payload', {})
+        headers = _header_dict(payload.get('headers'))
+        fields = {
+            "id": msg_data['id'],
+            "sender": headers.get('from', "Unknown"),
+            "subject": headers.get('subject', "No Subject"),
+            "date": headers.get('date', "Unknown Date"),
+            "thread_id": msg_data['threadId'],
+            # Needed to thread replies correctly (In-Reply-To / References)
+            "rfc_message_id": headers.get('message-id', ""),
+            "references": headers.get('references', ""),
+            "label_ids": msg_data.get('labelIds', []),
+            "internal_date": int(msg_data.get('internalDate', 0)),
+        }
+        message = cls(fields, payload)
+        message['attachments'] = [
+            {k: v for k, v in attachment.items() if k != 'data'} for attachment in message._walk()[2]
+        ]
+        return message
+
+    @classmethod
+    def from_dict(cls, data):
+        """Inverse of to_dict; plain dicts without a payload are returned as they are."""
+        if 'payload' not in data:
+            return data
+        fields = dict(data)
+        return cls(fields, fields.pop('payload'))
+
+    def to_dict(self):
+        """Serializable form that keeps the raw payload instead of decoded bodies."""
+        fields = {k: v for k, v in self.items() if k not in self.LAZY_KEYS}
+        fields['payload'] = self.payload
+        return fields
+
+    def _walk(self):
+        if self._parts is None:
+            self._parts = walk_parts(self.payload)
+        return self._parts
+
+    def _decode(self, key):
+        text_part, html_part, _ = self._walk()
+        if key == 'html':
+            return _decode_text(html_part) if html_part else ''
+        if text_part is not None:
+            return _decode_text(text_part)
+        return html_to_text(self['html']) if html_part is not None else ''
+
+    def __missing__(self, key):
+        if key not in self.LAZY_KEYS:
+            raise KeyError(key)
+        value = self._decode(key)
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self.LAZY_KEYS or super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key in self.LAZY_KEYS:
+            return self[key]
+        return super().get(key, default)
+
+    def attachment_data(self, attachment):
+        """Inline attachment bytes when Gmail included them, else None (fetch via the API)."""
+        for candidate in self._walk()[2]:
+            if candidate['part_id'] == attachment['part_id'] and candidate['data']:
+                return decode_base64url(candidate['data'])
+        return None
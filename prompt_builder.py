@@ -0,0 +1,207 @@
+"""
+Token-budgeted prompt assembly for summaries and reply drafts.
+Email bodies are cleaned of quoted history and signatures and truncated to a
+budget; knowledge-base context is packed in rank order until the budget is hit.
+Every prompt reports how many tokens it uses. Batch summary prompts pack
+several emails into one request sized to the context window.
+"""
+
+import re
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken is optional; fall back to a character-based estimate
+    _ENCODING = None
+
+MODEL_CONTEXT_WINDOW = 8192
+RESERVED_COMPLETION_TOKENS = 1024
+# A prompt may never take more than this, so prompt plus reply always fit the model
+MAX_PROMPT_BUDGET = MODEL_CONTEXT_WINDOW - RESERVED_COMPLETION_TOKENS
+# Kept well below the context window to bound latency and cost per email
+DEFAULT_PROMPT_BUDGET = 3072
+# Share of the budget a body may take when knowledge-base context is also included
+KB_BODY_SHARE = 0.5
+# Batch summaries: each email is cut shorter, and a batch holds no more emails
+# than there are summaries fitting in the completion allowance
+BATCH_SUMMARY_BODY_TOKENS = 300
+SUMMARY_TOKENS_PER_EMAIL = 80
+
+TRUNCATION_MARKER = "\n[...]\n"
+
+DRAFT_REPLY_TEMPLATE = (
+    "Draft a professional and helpful reply to this email. Be concise and friendly:\n\n"
+    "Original email:\n{body}"
+)
+SUMMARY_TEMPLATE = "Provide a concise summary of this email in 2-3 sentences:\n\n{body}"
+BATCH_SUMMARY_TEMPLATE = (
+    "Summarize each email below in 1-2 sentences. Respond with only a JSON object that maps "
+    "each email's id to its summary, like {{\"<id>\": \"<summary>\"}}.\n\n{emails}"
+)
+BATCH_EMAIL_TEMPLATE = "### Email id: {id}\n{body}"
+KB_DRAFT_TEMPLATE = (
+    "You are an AI assistant. Use the following context from our knowledge base to draft a reply to the email below. "
+    "Be professional, helpful, and friendly. If the context is not sufficient to answer the question, politely say so.\n\n"
+    "--- Knowledge Base Context ---\n{context}\n\n"
+    "--- Original Email ---\n{body}"
+)
+
+# Lines that start the quoted previous message in a reply
+QUOTE_HEADER_RE = re.compile(
+    r"^(On .{0,200}wrote:|-{2,}\s*Original Message\s*-{2,}|-{2,}\s*Forwarded message\s*-{2,})$",
+    re.IGNORECASE
+)
+# Outlook quotes the previous message under a From:/Sent:/To:/Subject: header block.
+# A lone "From:" line (e.g. in a contact form submission) is part of the message.
+OUTLOOK_FROM_RE = re.compile(r"^From: .+$", re.IGNORECASE)
+OUTLOOK_DATE_RE = re.compile(r"^(Sent|Date): .+$", re.IGNORECASE)
+OUTLOOK_TO_RE = re.compile(r"^(To|Subject): .+$", re.IGNORECASE)
+SIGNATURE_RE = re.compile(r"^(-- ?|__+|Sent from my .+|Get Outlook for .+)$", re.IGNORECASE)
+
+
+def count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _truncate_tokens(text, max_tokens):
+    """Cut `text` to at most `max_tokens` tokens from the start."""
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def _starts_outlook_header(lines, i):
+    """True if lines[i] is the From: line of an Outlook header block (From:, Sent:/Date:, To:/Subject:)."""
+    if not OUTLOOK_FROM_RE.match(lines[i].strip()):
+        return False
+    following = [line.strip() for line in lines[i + 1:i + 5] if line.strip()][:3]
+    return (any(OUTLOOK_DATE_RE.match(line) for line in following)
+            and any(OUTLOOK_TO_RE.match(line) for line in following))
+
+
+def strip_quoted_and_signature(body):
+    """Drop quoted reply history ("> ..." lines, "On ... wrote:" blocks) and the signature."""
+    kept = []
+    lines = body.splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if (QUOTE_HEADER_RE.match(stripped) or _starts_outlook_header(lines, i)) and kept:
+            break
+        if SIGNATURE_RE.match(stripped) and kept:
+            break
+        if stripped.startswith('>'):
+            continue
+        kept.append(line)
+    cleaned = "\n".join(kept).strip()
+    # Never strip an email down to nothing
+    return cleaned or body.strip()
+
+
+def truncate_body(body, max_tokens):
+    """
+    Fit a body into `max_tokens`, keeping the opening (usually the request) and the
+    end (usually the question or sign-off) with a marker in between.
+    """
+    if count_tokens(body) <= max_tokens:
+        return body, False
+    marker_tokens = count_tokens(TRUNCATION_MARKER)
+    head_tokens = max(0, int((max_tokens - marker_tokens) * 0.7))
+    tail_tokens = max(0, max_tokens - marker_tokens - head_tokens)
+    head = _truncate_tokens(body, head_tokens)
+    # Fill the tail with whole lines from the end of what the head didn't keep
+    tail_lines = []
+    for line in reversed(body[len(head):].splitlines()):
+        cost = count_tokens(line) + 1
+        if cost > tail_tokens:
+            break
+        tail_lines.append(line)
+        tail_tokens -= cost
+    return head.rstrip() + TRUNCATION_MARKER + "\n".join(reversed(tail_lines)).lstrip(), True
+
+
+def _prompt(content, truncated, context_entries=0):
+    return {
+        "messages": [{"role": "user", "content": content}],
+        "tokens": count_tokens(content),
+        "truncated": truncated,
+        "context_entries": context_entries,
+    }
+
+
+def _body_for(template, body, budget, **fields):
+    budget = min(budget, MAX_PROMPT_BUDGET)
+    overhead = count_tokens(template.format(body="", **fields))
+    return truncate_body(strip_quoted_and_signature(body), max(0, budget - overhead))
+
+
+def draft_reply_prompt(body, budget=DEFAULT_PROMPT_BUDGET):
+    body, truncated = _body_for(DRAFT_REPLY_TEMPLATE, body, budget)
+    return _prompt(DRAFT_REPLY_TEMPLATE.format(body=body), truncated)
+
+
+def summary_prompt(body, budget=DEFAULT_PROMPT_BUDGET):
+    body, truncated = _body_for(SUMMARY_TEMPLATE, body, budget)
+    return _prompt(SUMMARY_TEMPLATE.format(body=body), truncated)
+
+
+def format_kb_entry(entry):
+    return f"Q: {entry['question']}\nA: {entry['answer']}"
+
+
+def kb_draft_prompt(body, kb_entries, budget=DEFAULT_PROMPT_BUDGET):
+    """
+    Reply prompt grounded in knowledge-base entries, given best first.
+    The body takes at most KB_BODY_SHARE of the budget; entries are then packed in
+    rank order while they fit, skipping any single entry that is too large.
+    """
+    budget = min(budget, MAX_PROMPT_BUDGET)
+    body, truncated = _body_for(KB_DRAFT_TEMPLATE, body, int(budget * KB_BODY_SHARE), context="")
+    remaining = budget - count_tokens(KB_DRAFT_TEMPLATE.format(body=body, context=""))
+
+    packed = []
+    for entry in kb_entries:
+        text = format_kb_entry(entry)
+        cost = count_tokens(text) + 1
+        if cost <= remaining:
+            packed.append(text)
+            remaining -= cost
+    context = "\n\n".join(packed)
+    return _prompt(KB_DRAFT_TEMPLATE.format(body=body, context=context), truncated, len(packed))
+
+
+def batch_summary_prompts(emails, budget=MAX_PROMPT_BUDGET, body_budget=BATCH_SUMMARY_BODY_TOKENS):
+    """
+    Pack emails (dicts with 'id' and 'body') into as few JSON-mode summary prompts as fit.
+    A batch is closed when the next email would overflow the budget or its summary
+    would overflow the completion allowance. Each prompt also carries the "ids" it covers.
+    """
+    budget = min(budget, MAX_PROMPT_BUDGET)
+    max_per_batch = max(1, RESERVED_COMPLETION_TOKENS // SUMMARY_TOKENS_PER_EMAIL)
+    overhead = count_tokens(BATCH_SUMMARY_TEMPLATE.format(emails=""))
+
+    batches = []
+    current = []
+    used = overhead
+    for email in emails:
+        body, truncated = truncate_body(strip_quoted_and_signature(email['body']), body_budget)
+        section = BATCH_EMAIL_TEMPLATE.format(id=email['id'], body=body)
+        cost = count_tokens(section) + 2
+        if current and (used + cost > budget or len(current) >= max_per_batch):
+            batches.append(current)
+            current = []
+            used = overhead
+        current.append((email['id'], section, truncated))
+        used += cost
+    if current:
+        batches.append(current)
+
+    prompts = []
+    for batch in batches:
+        content = BATCH_SUMMARY_TEMPLATE.format(emails="\n\n".join(section for _, section, _ in batch))
+        prompt = _prompt(content, any(truncated for _, _, truncated in batch))
+        prompt["ids"] = [message_id for message_id, _, _ in batch]
+        prompts.append(prompt)
+    return prompts
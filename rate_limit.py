@@ -0,0 +1,119 @@
+"""
+Client-side rate limiting and retry helpers shared by the Gmail and LLM code paths.
+"""
+
+import random
+import threading
+import time
+
+import metrics
+
+# HTTP statuses worth retrying: rate limited or a transient server-side failure
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Gmail also reports per-user quota exhaustion as 403 with one of these reasons
+RATE_LIMIT_403_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+class RateLimiter:
+    """
+    Thread-safe token-bucket limiter for requests per minute and (optionally)
+    tokens per minute. `acquire` blocks until the request fits in both budgets.
+    `burst` caps how many requests may go out back to back (defaults to a full minute's worth).
+    When `name` is given, time spent waiting is recorded as throttled_seconds of that operation.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, burst=None, name=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._buckets = {}
+        if requests_per_minute:
+            self._buckets['requests'] = self._new_bucket(requests_per_minute, burst)
+        if tokens_per_minute:
+            self._buckets['tokens'] = self._new_bucket(tokens_per_minute)
+        self._updated = time.monotonic()
+
+    @staticmethod
+    def _new_bucket(per_minute, capacity=None):
+        capacity = float(capacity or per_minute)
+        return {'capacity': capacity, 'rate': per_minute / 60.0, 'level': capacity}
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        for bucket in self._buckets.values():
+            bucket['level'] = min(bucket['capacity'], bucket['level'] + elapsed * bucket['rate'])
+
+    def acquire(self, tokens=0):
+        """Block until one request carrying `tokens` tokens may be sent."""
+        cost = {'requests': 1, 'tokens': tokens}
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                for name, bucket in self._buckets.items():
+                    # A single request larger than the bucket only has to wait for a full bucket
+                    needed = min(cost[name], bucket['capacity'])
+                    if bucket['level'] < needed:
+                        wait = max(wait, (needed - bucket['level']) / bucket['rate'])
+                if wait <= 0:
+                    for name, bucket in self._buckets.items():
+                        bucket['level'] -= min(cost[name], bucket['capacity'])
+                    break
+            time.sleep(wait)
+            waited += wait
+        if waited and self.name:
+            metrics.add(self.name, throttled_seconds=waited)
+
+
+def error_status(exc):
+    """Best-effort HTTP status of an exception raised by the Groq or Google clients."""
+    status = getattr(exc, 'status_code', None)
+    if status is None and getattr(exc, 'resp', None) is not None:
+        status = getattr(exc.resp, 'status', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(exc):
+    """A 429 or Gmail's 403 rate-limit error: the request was rejected, so nothing happened server-side."""
+    status = error_status(exc)
+    return status == 429 or (status == 403 and any(reason in str(exc) for reason in RATE_LIMIT_403_REASONS))
+
+
+def is_transient(exc):
+    """A timeout, dropped connection or 5xx: the server may or may not have acted on the request."""
+    if error_status(exc) in RETRYABLE_STATUSES - {429}:
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__name__ in (
+        'APITimeoutError', 'APIConnectionError'
+    )
+
+
+def is_retryable(exc):
+    """Retry on 429/5xx responses, Gmail's 403 rate-limit errors, and timeouts or dropped connections."""
+    return is_rate_limited(exc) or is_transient(exc)
+
+
+def call_with_retry(fn, max_retries=3, base_delay=1.0, max_delay=30.0, retryable=is_retryable, name=None):
+    """
+    Call `fn()` and retry retryable failures with exponential backoff and jitter.
+    The last exception is re-raised once `max_retries` retries are used up.
+    Retries are counted against operation `name` when given.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not retryable(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            if name:
+                metrics.add(name, retries=1)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
@@ -0,0 +1,107 @@
+"""
+Bulk reply sending.
+Replies are sent concurrently through a bounded worker pool, throttled to stay
+under Gmail's per-user quota (one limiter per account). Sending isn't idempotent, so
+only rate-limit rejections are retried; a timeout or 5xx may have sent the reply
+already and is reported as an unknown outcome instead.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from gmail_api import reply_to_email, DEFAULT_ACCOUNT
+from rate_limit import RateLimiter, call_with_retry, is_rate_limited, is_transient
+
+# messages.send costs 100 of the 250 quota units Gmail allows per user per second
+SENDS_PER_MINUTE = 150
+SEND_BURST = 2
+DEFAULT_MAX_WORKERS = 4
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def new_send_limiter(account=DEFAULT_ACCOUNT):
+    # Waits are charged to the account's quota in the diagnostics
+    return RateLimiter(SENDS_PER_MINUTE, burst=SEND_BURST, name=f"gmail.quota.{account}")
+
+
+def send_limiter_for(account):
+    """Process-wide send limiter of an account; Gmail's quota is per user, so accounts don't share one."""
+    with _limiters_lock:
+        limiter = _limiters.get(account)
+        if limiter is None:
+            limiter = _limiters[account] = new_send_limiter(account)
+        return limiter
+
+
+def _send_one(email, body, rate_limiter, max_retries):
+    attempts = 0
+
+    def attempt():
+        nonlocal attempts
+        attempts += 1
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        # Each send checks out a pooled Gmail service, so connections outlive the worker threads
+        return reply_to_email(email, body)
+
+    started = time.monotonic()
+    try:
+        # Retrying after a timeout could deliver the same reply twice
+        response = call_with_retry(
+            attempt, max_retries=max_retries, retryable=is_rate_limited, name="gmail.messages.send"
+        )
+        return {"ok": True, "outcome": "sent", "message_id": response.get('id'), "error": None,
+                "attempts": attempts, "seconds": time.monotonic() - started}
+    except Exception as e:
+        if is_transient(e):
+            return {"ok": False, "outcome": "unknown", "message_id": None,
+                    "error": f"outcome unknown, the reply may have been sent ({e})",
+                    "attempts": attempts, "seconds": time.monotonic() - started}
+        return {"ok": False, "outcome": "failed", "message_id": None, "error": str(e),
+                "attempts": attempts, "seconds": time.monotonic() - started}
+
+
+def iter_send_replies(replies, max_workers=DEFAULT_MAX_WORKERS, rate_limiter=None, max_retries=3):
+    """
+    Send many replies concurrently. `replies` maps a caller-chosen key to an
+    (email dict, reply body) pair. Yields (key, result) as each send finishes, where
+    result is a dict with ok, outcome ("sent", "failed" or "unknown"), message_id,
+    error, attempts and seconds.
+    Without `rate_limiter`, each email's account is throttled by its own limiter.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(
+                _send_one, email, body,
+                rate_limiter or send_limiter_for(email.get('account', DEFAULT_ACCOUNT)), max_retries
+            ): key
+            for key, (email, body) in replies.items()
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def send_replies(replies, **kwargs):
+    """Send all replies and return ({key: result}, throughput summary)."""
+    started = time.monotonic()
+    results = dict(iter_send_replies(replies, **kwargs))
+    return results, summarize_results(results, time.monotonic() - started)
+
+
+def summarize_results(results, elapsed):
+    sent = sum(1 for result in results.values() if result['ok'])
+    unknown = sum(1 for result in results.values() if result.get('outcome') == "unknown")
+    return {
+        "sent": sent,
+        "failed": len(results) - sent - unknown,
+        "unknown": unknown,
+        "seconds": elapsed,
+        "per_second": sent / elapsed if elapsed > 0 else 0.0,
+    }
@@ -1,20 +1,43 @@
 import streamlit as st
+import pandas as pd
 import os
 import json
-from groq import Groq
+import time
+import metrics
 from gmail_api import (
-    get_unread_emails,
-    send_email_reply,
-    get_gmail_service,
+    sync_unread_emails,
+    sync_accounts,
+    merge_inboxes,
+    list_accounts,
+    account_path,
+    DEFAULT_ACCOUNT,
+    MAX_PAGE_SIZE,
+    reply_to_email,
+    fetch_attachment,
+    get_credentials,
+    reset_gmail_service,
     load_knowledge_base,
     find_relevant_knowledge,
-    update_knowledge_base
+    update_knowledge_base,
+    export_knowledge_base,
+    RETRIEVAL_BACKENDS
 )
+from message_store import MessageStore, DEFAULT_DB_PATH
+from llm_cache import LLMCache
+from send_queue import iter_send_replies, summarize_results
+from llm_engine import generate_drafts, new_client, new_rate_limiter, stream_completion, summarize_many
+from prompt_builder import draft_reply_prompt, summary_prompt, kb_draft_prompt
+from clustering import cluster_emails, cluster_lookup
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 
 st.set_page_config(page_title="AI Email Assistant", layout="wide", initial_sidebar_state="expanded")
 
+# Emails are fetched page by page; the first page is kept small so results show up quickly,
+# later pages are as large as Gmail allows so a full load takes few list calls
+FIRST_EMAIL_PAGE_SIZE = 25
+MAX_EMAILS = 500
+
 # Custom CSS for better styling
 st.markdown("""
 <style>
@@ -37,25 +60,271 @@ st.markdown("### Manage your Gmail with AI-powered assistance")
 # Initialize session state
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
-if 'emails' not in st.session_state:
-    st.session_state.emails = []
 
 # Check for Groq API key
 if "groq_api_key" in st.secrets:
-    groq_client = Groq(api_key=st.secrets["groq_api_key"])
+    groq_client = new_client(st.secrets["groq_api_key"])
 else:
     groq_api_key = st.sidebar.text_input("Enter Groq API Key", type="password")
     if groq_api_key:
-        groq_client = Groq(api_key=groq_api_key)
+        groq_client = new_client(groq_api_key)
     else:
         st.warning("Please enter your Groq API key in the sidebar to enable AI features.")
         groq_client = None
 
+@st.cache_resource
+def get_message_store(account=DEFAULT_ACCOUNT):
+    """Shared local cache of an account's fetched emails, reused across reruns and sessions"""
+    return MessageStore(account_path(account, DEFAULT_DB_PATH))
+
+def load_cached_inbox(accounts):
+    """Unified inbox of the accounts' cached emails, newest first"""
+    inboxes = []
+    for account in accounts:
+        emails = get_message_store(account).unread_emails(limit=MAX_EMAILS)
+        for email in emails:
+            email['account'] = account
+        inboxes.append(emails)
+    return merge_inboxes(inboxes, MAX_EMAILS)
+
+def switch_accounts():
+    """The email list is about to change, so drop per-email state and reload from the caches"""
+    reset_email_state()
+    st.session_state.pop('emails', None)
+
+# Emails are listed one page at a time
+PAGE_SIZES = [10, 25, 50, 100]
+DEFAULT_PAGE_SIZE = 25
+
+# Every mailbox with a profile (python gmail_setup.py --account NAME) can be watched from this one app
+available_accounts = list_accounts() or [DEFAULT_ACCOUNT]
+if len(available_accounts) > 1:
+    accounts = st.sidebar.multiselect(
+        "📮 Accounts", available_accounts, default=available_accounts, key="accounts", on_change=switch_accounts
+    )
+else:
+    accounts = available_accounts
+
+# Start from whatever was last synced (e.g. by inbox_worker.py) without calling Gmail
+if 'emails' not in st.session_state:
+    st.session_state.emails = load_cached_inbox(accounts)
+
+PER_EMAIL_KEYS = ("email_table_", "draft_", "summary_", "reply_", "email_body_", "attachment_", "reviewed_")
+
+if 'selected_emails' not in st.session_state:
+    st.session_state.selected_emails = set()
+
+# Emails whose current draft the user has marked as reviewed; sending to a group of similar emails needs all of them
+if 'reviewed_emails' not in st.session_state:
+    st.session_state.reviewed_emails = set()
+
+# Emails whose draft was written for another member of their group; bulk sends need them reviewed too
+if 'shared_drafts' not in st.session_state:
+    st.session_state.shared_drafts = set()
+
+def reset_email_state():
+    """Per-email widget state is keyed by list position, so drop it when the list changes"""
+    for key in list(st.session_state.keys()):
+        if key.startswith(PER_EMAIL_KEYS):
+            del st.session_state[key]
+    st.session_state.selected_emails = set()
+    st.session_state.reviewed_emails = set()
+    st.session_state.shared_drafts = set()
+    st.session_state.pop('clusters', None)
+
+def apply_selection_edits(table_key, page_indices):
+    """
+    Fold checkbox edits from the email table into the selection, which survives paging.
+    The editor keeps every edit since it was created, so replaying them is only safe
+    while the selection hasn't changed elsewhere (see refresh_email_table).
+    """
+    for row, changes in st.session_state[table_key]["edited_rows"].items():
+        if "Select" in changes:
+            if changes["Select"]:
+                st.session_state.selected_emails.add(page_indices[row])
+            else:
+                st.session_state.selected_emails.discard(page_indices[row])
+
+def refresh_email_table():
+    """The selection changed outside the table; a new table key drops the editor's stale checkbox edits"""
+    st.session_state.table_version = st.session_state.get('table_version', 0) + 1
+
+def set_draft(idx, draft, shared=False):
+    """
+    Store a new draft and drop the reply widget's state so the text area shows it; it needs a new review.
+    `shared` marks a draft written for another email of the same group.
+    """
+    st.session_state[f"draft_{idx}"] = draft
+    st.session_state.pop(f"draft_cached_{idx}", None)
+    if shared:
+        st.session_state.shared_drafts.add(idx)
+    else:
+        st.session_state.shared_drafts.discard(idx)
+    st.session_state.pop(f"reply_{idx}", None)
+    st.session_state.reviewed_emails.discard(idx)
+    st.session_state.pop(f"reviewed_{idx}", None)
+
+def save_review(idx):
+    """Keep the reviewed checkbox in reviewed_emails, which outlives the widget when another email is opened"""
+    if st.session_state[f"reviewed_{idx}"]:
+        st.session_state.reviewed_emails.add(idx)
+    else:
+        st.session_state.reviewed_emails.discard(idx)
+
+def prompt_caption(prompt):
+    """One-line token report for a built prompt"""
+    caption = f"🔢 Prompt: {prompt['tokens']} tokens"
+    if prompt['context_entries']:
+        caption += f", {prompt['context_entries']} KB entries"
+    if prompt['truncated']:
+        caption += " (email truncated to fit)"
+    return caption
+
+def stream_to_state(client, prompt, store, stop_key, refresh=False):
+    """
+    Render a completion token by token, passing the text so far to `store` as it grows.
+    Pressing Stop (or any other widget) interrupts the run mid-stream; the partial
+    text is kept and the HTTP stream is closed. `refresh` skips the cached reply.
+    Returns the stream stats, whose `cached` tells whether the reply came from the cache.
+    """
+    stats = {}
+    chunks = stream_completion(
+        client, prompt['messages'], rate_limiter=get_rate_limiter(), cache=get_llm_cache(), stats=stats,
+        refresh=refresh
+    )
+
+    def collect():
+        text = ""
+        for chunk in chunks:
+            text += chunk
+            store(text)
+            yield chunk
+
+    st.button("⏹️ Stop", key=stop_key)
+    try:
+        st.write_stream(collect())
+    finally:
+        chunks.close()
+    if stats.get('cached'):
+        st.caption(prompt_caption(prompt) + " · ⚡ from cache")
+    else:
+        st.caption(
+            prompt_caption(prompt)
+            + f" · ⏱️ first token {stats.get('first_token_seconds', 0):.2f}s, done in {stats.get('total_seconds', 0):.2f}s"
+        )
+    return stats
+
+def stream_draft(client, idx, prompt, stop_key, refresh=False):
+    """Stream a draft into the reply box; a draft served from the cache remembers its prompt so it can be regenerated"""
+    stats = stream_to_state(client, prompt, lambda text: set_draft(idx, text), stop_key, refresh=refresh)
+    if stats.get('cached'):
+        st.session_state[f"draft_cached_{idx}"] = prompt
+    return stats
+
+def bucket_ms(seconds):
+    """Histogram bucket bound in ms; the overflow bucket has none"""
+    return None if seconds is None or seconds == float("inf") else round(seconds * 1000)
+
+def render_diagnostics(container):
+    """Per-operation call counts, latency percentiles, bytes, tokens and retries, plus dumps for dashboards"""
+    ops = metrics.snapshot()
+    with container:
+        if not ops:
+            st.caption("No calls recorded yet.")
+            return
+        rows = [
+            {
+                "Operation": name,
+                "Calls": stats['calls'],
+                "Errors": stats['errors'],
+                "p50 ≤ ms": bucket_ms(stats['p50_seconds']),
+                "p95 ≤ ms": bucket_ms(stats['p95_seconds']),
+                "Total s": round(stats['seconds'], 2),
+                "KB in": round(stats['bytes_received'] / 1024, 1),
+                "KB out": round(stats['bytes_sent'] / 1024, 1),
+                "Tokens": stats['prompt_tokens'] + stats['completion_tokens'],
+                "Retries": stats['retries'],
+                "Throttled s": round(stats['throttled_seconds'], 2),
+                "Quota units": stats['quota_units'],
+            }
+            for name, stats in ops.items()
+        ]
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        d_col1, d_col2 = st.columns(2)
+        with d_col1:
+            st.download_button("⬇️ JSON", metrics.to_json(), file_name="metrics.json", mime="application/json")
+        with d_col2:
+            st.download_button("⬇️ Prometheus", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        if st.button("🧹 Reset metrics"):
+            metrics.reset()
+            st.rerun()
+
+def send_with_progress(approved):
+    """Send {idx: (email, reply)} with a progress bar, clear what was sent and report failures"""
+    # A draft copied from a similar email is only sent once someone has read it for this email
+    unreviewed = [
+        idx for idx in approved
+        if idx in st.session_state.shared_drafts and idx not in st.session_state.reviewed_emails
+    ]
+    if unreviewed:
+        st.warning(
+            f"⚠️ Skipping {len(unreviewed)} email(s) whose draft was shared with similar emails and not reviewed yet: "
+            + ", ".join(st.session_state.emails[idx]['sender'] for idx in unreviewed[:5])
+            + (" …" if len(unreviewed) > 5 else "")
+            + ". Open each one and tick \"👀 I reviewed this reply\"."
+        )
+        approved = {idx: item for idx, item in approved.items() if idx not in unreviewed}
+        if not approved:
+            return
+    progress_bar = st.progress(0, text="Sending replies...")
+    results = {}
+    started = time.monotonic()
+    for done, (idx, result) in enumerate(iter_send_replies(approved), start=1):
+        results[idx] = result
+        if result['ok']:
+            set_draft(idx, "")
+            st.session_state.selected_emails.discard(idx)
+            refresh_email_table()
+        progress_bar.progress(done / len(approved), text=f"Sent {done}/{len(approved)} replies")
+
+    stats = summarize_results(results, time.monotonic() - started)
+    st.success(
+        f"✅ Sent {stats['sent']} replies in {stats['seconds']:.1f}s "
+        f"({stats['per_second']:.1f}/s); {stats['failed']} failed, {stats['unknown']} unknown"
+    )
+    for idx, result in results.items():
+        if result['outcome'] == "unknown":
+            # Not retried automatically, since Gmail may have sent it; the draft is kept for a manual resend
+            st.warning(
+                f"⚠️ {st.session_state.emails[idx]['subject']}: {result['error']}. "
+                "Check your Sent folder before sending it again."
+            )
+        elif not result['ok']:
+            st.error(
+                f"❌ {st.session_state.emails[idx]['subject']}: {result['error']} "
+                f"(after {result['attempts']} attempts)"
+            )
+
+def save_reply(idx):
+    """Keep reply edits in draft_{idx}, which outlives the reply widget when another email is opened"""
+    st.session_state[f"draft_{idx}"] = st.session_state[f"reply_{idx}"]
+
+@st.cache_resource
+def get_rate_limiter():
+    """Process-wide Groq rate limiter shared by every session"""
+    return new_rate_limiter()
+
+@st.cache_resource
+def get_llm_cache():
+    """On-disk cache of summaries and drafts so repeat views cost no tokens"""
+    return LLMCache()
+
 # Authentication status check
-def check_gmail_auth():
+def check_gmail_auth(account=DEFAULT_ACCOUNT):
     """Check if Gmail is authenticated"""
     try:
-        service = get_gmail_service()
+        # Credentials are cached in process, so this doesn't rebuild the service on every rerun
+        get_credentials(account)
         return True
     except:
         return False
@@ -64,14 +333,22 @@ def check_gmail_auth():
 with st.sidebar:
     st.header("🔐 Authentication")
 
-    if check_gmail_auth():
-        st.success("✅ Gmail Connected")
+    connected_accounts = [account for account in accounts if check_gmail_auth(account)]
+    if connected_accounts:
+        if len(accounts) > 1:
+            st.success(f"✅ Gmail Connected ({len(connected_accounts)}/{len(accounts)} accounts)")
+            for account in accounts:
+                st.caption(f"{'✅' if account in connected_accounts else '⚠️'} {account}")
+        else:
+            st.success("✅ Gmail Connected")
         st.session_state.authenticated = True
 
         if st.button("🔄 Refresh Authentication"):
             # Clear existing credentials to force re-auth
-            if os.path.exists('token.pickle'):
-                os.remove('token.pickle')
+            for account in accounts:
+                if os.path.exists(account_path(account, 'token.pickle')):
+                    os.remove(account_path(account, 'token.pickle'))
+            reset_gmail_service()
             st.rerun()
     else:
         st.warning("⚠️ Gmail Not Connected")
@@ -84,11 +361,18 @@ with st.sidebar:
         st.markdown("3. Refresh this page")
 
         if st.button("🔄 Check Connection"):
+            reset_gmail_service()
             st.rerun()
 
     # Sidebar for Knowledge Base Management
     with st.sidebar:
         st.header("📚 Knowledge Base")
+        retrieval_backend = st.radio(
+            "Retrieval",
+            RETRIEVAL_BACKENDS,
+            format_func=lambda backend: {"bm25": "Keyword (BM25)", "semantic": "Semantic (embeddings)"}[backend],
+            horizontal=True
+        )
         st.markdown("Drag and drop a JSON file here to add new Q&A pairs to your knowledge base.")
         
         uploaded_file = st.file_uploader(
@@ -114,19 +398,59 @@ with st.sidebar:
             except Exception as e:
                 st.error(f"An error occurred: {e}")
 
+        # Uploads only write to the SQLite store; export on demand to refresh the JSON copy
+        if st.button("💾 Export Knowledge Base to JSON"):
+            st.success(f"✅ Exported to `{export_knowledge_base()}`")
+
+        cache_stats = get_llm_cache().stats()
+        st.caption(
+            f"🗄️ LLM cache: {cache_stats['entries']} entries, "
+            f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+        )
+
+        # Filled in at the end of the script so it includes the calls made during this run
+        diagnostics = st.expander("🩺 Diagnostics")
+
 # Main content area
 if st.session_state.authenticated:
     col1, col2 = st.columns([2, 1])
 
     with col1:
         if st.button("📥 Load Unread Emails", use_container_width=True):
-            with st.spinner("Connecting to Gmail and fetching unread emails..."):
+            status = st.empty()
+            preview = st.container()
+            emails = []
+            status.info("Connecting to Gmail and fetching unread emails...")
+            if len(connected_accounts) == 1:
+                account = connected_accounts[0]
                 try:
-                    emails = get_unread_emails()
-                    st.session_state.emails = emails
-                    st.success(f"✅ Fetched {len(emails)} unread email(s)")
+                    # Render each email as soon as its batch arrives instead of waiting for the whole inbox;
+                    # after the first load only changes since the last sync are fetched from Gmail
+                    for email in sync_unread_emails(get_message_store(account), page_size=MAX_PAGE_SIZE,
+                                                    first_page_size=FIRST_EMAIL_PAGE_SIZE,
+                                                    max_results=MAX_EMAILS, account=account):
+                        emails.append(email)
+                        preview.markdown(f"- **{email['subject']}** from {email['sender']}")
+                        status.info(f"Fetching unread emails... {len(emails)} so far")
+                    status.success(f"✅ Fetched {len(emails)} unread email(s)")
                 except Exception as e:
-                    st.error(f"❌ Error connecting to Gmail: {str(e)}")
+                    status.error(f"❌ Error connecting to Gmail: {str(e)}")
+            else:
+                # All inboxes sync at once and are merged by date into one list
+                inboxes = []
+                stores = {account: get_message_store(account) for account in connected_accounts}
+                for account, account_emails, error in sync_accounts(
+                    stores, page_size=MAX_PAGE_SIZE, max_results=MAX_EMAILS
+                ):
+                    if error is not None:
+                        preview.error(f"❌ {account}: {str(error)}")
+                    else:
+                        inboxes.append(account_emails)
+                        preview.markdown(f"- **{account}**: {len(account_emails)} unread")
+                emails = merge_inboxes(inboxes, MAX_EMAILS)
+                status.success(f"✅ Fetched {len(emails)} unread email(s) from {len(inboxes)} account(s)")
+            reset_email_state()
+            st.session_state.emails = emails
 
     with col2:
         if st.session_state.emails:
@@ -138,159 +462,316 @@ else:
 if st.session_state.authenticated and st.session_state.emails:
     st.header(f"📧 Unread Emails ({len(st.session_state.emails)})")
 
+    # Near-duplicate emails are grouped so one draft can serve the whole group
+    if 'clusters' not in st.session_state:
+        st.session_state.clusters = cluster_lookup(cluster_emails(st.session_state.emails))
+    clusters = st.session_state.clusters
+
+    # Drafts prepared by the background worker fill in any reply not drafted here yet
+    worker_drafts = {}
+    for account in {email.get('account', DEFAULT_ACCOUNT) for email in st.session_state.emails}:
+        worker_drafts.update(get_message_store(account).get_drafts(
+            email['id'] for email in st.session_state.emails if email.get('account', DEFAULT_ACCOUNT) == account
+        ))
+    for idx, email in enumerate(st.session_state.emails):
+        if f"draft_{idx}" not in st.session_state and email['id'] in worker_drafts:
+            st.session_state[f"draft_{idx}"] = worker_drafts[email['id']]
+            # The worker drafts once per group and copies it to every member
+            if len(clusters[idx]) > 1:
+                st.session_state.shared_drafts.add(idx)
+
     # Add a global "Auto-Reply" button for selected emails
     if groq_client:
         st.info("💡 **Pro-Tip:** Select multiple emails and click the button below to generate all drafts at once!")
         if st.button("🤖 Generate Draft Replies for Selected Emails", use_container_width=True):
 
-            selected_indices = [
-                i for i, email in enumerate(st.session_state.emails)
-                if st.session_state.get(f"select_{i}", False)
-            ]
+            selected_indices = sorted(st.session_state.selected_emails)
 
             if not selected_indices:
                 st.warning("⚠️ Please select at least one email first.")
             else:
                 progress_bar = st.progress(0, text="Generating drafts...")
                 total_selected = len(selected_indices)
-
-                for i, idx in enumerate(selected_indices):
-                    email = st.session_state.emails[idx]
-                    try:
-                        with st.spinner(f"Drafting reply for: {email['subject'][:50]}..."):
-                            response = groq_client.chat.completions.create(
-                                model="llama3-70b-8192",
-                                messages=[
-                                    {"role": "user", "content": f"Draft a professional and helpful reply to this email. Be concise and friendly:\n\nOriginal email:\n{email['body']}"}
-                                ]
-                            )
-                            draft = response.choices[0].message.content
-                            st.session_state[f"draft_{idx}"] = draft
-                    except Exception as e:
-                        st.error(f"Error drafting reply for email from {email['sender']}: {str(e)}")
+                # One request per group of near-duplicates, keyed by its first selected email
+                groups = {}
+                for idx in selected_indices:
+                    groups.setdefault(clusters[idx][0], []).append(idx)
+                groups = {members[0]: members for members in groups.values()}
+                prompts = {idx: draft_reply_prompt(st.session_state.emails[idx]['body']) for idx in groups}
+                jobs = {idx: prompt['messages'] for idx, prompt in prompts.items()}
+
+                # Drafts are generated concurrently and stored as each one finishes
+                for done, (idx, draft, error) in enumerate(
+                    generate_drafts(groq_client, jobs, rate_limiter=get_rate_limiter(), cache=get_llm_cache()),
+                    start=1
+                ):
+                    if error is None:
+                        for member in groups[idx]:
+                            set_draft(member, draft, shared=member != idx)
+                    else:
+                        st.error(f"Error drafting reply for email from {st.session_state.emails[idx]['sender']}: {str(error)}")
 
                     # Update progress bar
-                    progress_bar.progress((i + 1) / total_selected, text=f"Generated {i+1}/{total_selected} drafts")
+                    progress_bar.progress(done / len(groups), text=f"Generated {done}/{len(groups)} drafts")
 
-                st.success(f"✅ Successfully generated {total_selected} drafts!")
+                st.success(
+                    f"✅ Successfully generated {total_selected} drafts with {len(groups)} requests! "
+                    f"({sum(prompt['tokens'] for prompt in prompts.values())} prompt tokens)"
+                )
                 st.balloons()
 
+        # Triage: summaries for many emails come back several per request and show up in the table
+        if st.button("🧾 Summarize Selected Emails", use_container_width=True):
+            selected_indices = sorted(st.session_state.selected_emails)
+
+            if not selected_indices:
+                st.warning("⚠️ Please select at least one email first.")
+            else:
+                progress_bar = st.progress(0, text="Summarizing emails...")
+                index_by_id = {st.session_state.emails[idx]['id']: idx for idx in selected_indices}
+                batch_stats = {}
+                started = time.monotonic()
+                for done, (message_id, summary, error) in enumerate(
+                    summarize_many(
+                        groq_client, [st.session_state.emails[idx] for idx in selected_indices],
+                        rate_limiter=get_rate_limiter(), cache=get_llm_cache(), stats=batch_stats
+                    ),
+                    start=1
+                ):
+                    idx = index_by_id[message_id]
+                    if error is None:
+                        st.session_state[f"summary_{idx}"] = summary
+                    else:
+                        st.error(f"Error summarizing email from {st.session_state.emails[idx]['sender']}: {str(error)}")
+                    progress_bar.progress(done / len(selected_indices), text=f"Summarized {done}/{len(selected_indices)} emails")
+
+                st.success(
+                    f"✅ Summarized {len(selected_indices)} emails with {batch_stats['requests']} requests "
+                    f"in {time.monotonic() - started:.1f}s ({batch_stats['fallbacks']} sent individually)"
+                )
+
+    # Send every selected email that has a reply written, in one go
+    if st.button("📨 Send All Approved Replies", use_container_width=True):
+        approved = {}
+        for idx in sorted(st.session_state.selected_emails):
+            reply_text = st.session_state.get(f"draft_{idx}", "")
+            if reply_text.strip():
+                approved[idx] = (st.session_state.emails[idx], reply_text)
+
+        if not approved:
+            st.warning("⚠️ Select emails that have a reply written to send them.")
+        else:
+            send_with_progress(approved)
+
     st.markdown("---")
 
-    # Loop through emails and display them with a checkbox
-    for idx, email in enumerate(st.session_state.emails):
+    # Only one page of emails is rendered, as a single table; widgets are built for the opened email only
+    emails = st.session_state.emails
+    p_col1, p_col2 = st.columns([1, 1])
+    with p_col1:
+        page_size = st.selectbox("Emails per page", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE))
+    page_count = max(1, -(-len(emails) // page_size))
+    with p_col2:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key=f"page_{page_size}")
+    page_indices = list(range((page - 1) * page_size, min(page * page_size, len(emails))))
+
+    table_key = f"email_table_{page_size}_{page}_{st.session_state.get('table_version', 0)}"
+    page_table = pd.DataFrame(
+        {
+            "Select": [idx in st.session_state.selected_emails for idx in page_indices],
+            "Account": [emails[idx].get('account', DEFAULT_ACCOUNT) for idx in page_indices],
+            "From": [emails[idx]['sender'] for idx in page_indices],
+            "Subject": [emails[idx]['subject'] for idx in page_indices],
+            "Date": [emails[idx]['date'] for idx in page_indices],
+            "Draft": ["✅" if st.session_state.get(f"draft_{idx}") else "" for idx in page_indices],
+            "Summary": [st.session_state.get(f"summary_{idx}", "") for idx in page_indices],
+            "Similar": [f"×{len(clusters[idx])}" if len(clusters[idx]) > 1 else "" for idx in page_indices],
+        },
+        index=page_indices
+    )
+    if len(accounts) == 1:
+        page_table = page_table.drop(columns="Account")
+    st.data_editor(
+        page_table,
+        key=table_key,
+        on_change=apply_selection_edits,
+        args=(table_key, page_indices),
+        disabled=["Account", "From", "Subject", "Date", "Draft", "Summary", "Similar"],
+        column_config={
+            "Select": st.column_config.CheckboxColumn("✔", width="small"),
+            "Summary": st.column_config.TextColumn("Summary", width="large"),
+        },
+        hide_index=True,
+        use_container_width=True
+    )
+    st.caption(f"{len(st.session_state.selected_emails)} selected · page {page} of {page_count}")
+
+    idx = st.selectbox(
+        "Open email",
+        page_indices,
+        format_func=lambda i: f"{emails[i]['subject']} — {emails[i]['sender']}"
+    )
+    email = emails[idx]
+
+    with st.container(border=True):
+        # Email header info
+        h_col1, h_col2 = st.columns(2)
+        with h_col1:
+            st.markdown(f"**From:** {email['sender']}")
+        with h_col2:
+            st.markdown(f"**Date:** {email['date']}")
+
+        # Email body
+        st.markdown("**Email Content:**")
+        st.text_area("", value=email['body'], height=200, key=f"email_body_{idx}", disabled=True)
+
+        # Attachments are listed from metadata and only downloaded when asked for
+        for n, attachment in enumerate(email.get('attachments', [])):
+            data_key = f"attachment_{idx}_{n}"
+            if data_key in st.session_state:
+                st.download_button(
+                    f"⬇️ {attachment['filename']}", st.session_state[data_key],
+                    file_name=attachment['filename'], mime=attachment['mime_type'] or None,
+                    key=f"{data_key}_download"
+                )
+            elif st.button(f"📎 {attachment['filename']} ({attachment['size'] // 1024} KB)", key=f"{data_key}_fetch"):
+                try:
+                    st.session_state[data_key] = fetch_attachment(email, attachment)
+                except Exception as e:
+                    st.error(f"❌ Error downloading attachment: {str(e)}")
+                else:
+                    st.rerun()
 
-        col1, col2 = st.columns([0.05, 0.95])
-
-        with col1:
-            st.checkbox("", key=f"select_{idx}", label_visibility="collapsed")
-
-        with col2:
-            with st.expander(f"**{email['subject']}** from {email['sender']}", expanded=False):
-                # Email header info
-                h_col1, h_col2 = st.columns(2)
-                with h_col1:
-                    st.markdown(f"**From:** {email['sender']}")
-                with h_col2:
-                    st.markdown(f"**Date:** {email['date']}")
-
-                # Email body
-                st.markdown("**Email Content:**")
-                st.text_area("", value=email['body'], height=200, key=f"email_body_{idx}", disabled=True)
-
-                # AI Features
-                if groq_client:
-                    ai_col1, ai_col2 = st.columns(2)
-
-                    with ai_col1:
-                        if st.button(f"🧠 Summarize", key=f"summarize_btn_{idx}", use_container_width=True):
-                            with st.spinner("Generating summary..."):
-                                try:
-                                    response = groq_client.chat.completions.create(
-                                        model="llama3-70b-8192",
-                                        messages=[
-                                            {"role": "user", "content": f"Provide a concise summary of this email in 2-3 sentences:\n\n{email['body']}"}
-                                        ]
-                                    )
-                                    summary = response.choices[0].message.content
-                                    st.success("📝 **Summary:**")
-                                    st.write(summary)
-                                except Exception as e:
-                                    st.error(f"Error generating summary: {str(e)}")
-
-                    with ai_col2:
-                        # Individual draft button remains
-                        if st.button(f"✨ Draft Reply", key=f"draft_btn_{idx}", use_container_width=True):
-                            with st.spinner("Drafting reply..."):
-                                try:
-                                    response = groq_client.chat.completions.create(
-                                        model="llama3-70b-8192",
-                                        messages=[
-                                            {"role": "user", "content": f"Draft a professional and helpful reply to this email. Be concise and friendly:\n\nOriginal email:\n{email['body']}"}
-                                        ]
-                                    )
-                                    draft = response.choices[0].message.content
-                                    st.session_state[f"draft_{idx}"] = draft
-                                except Exception as e:
-                                    st.error(f"Error drafting reply: {str(e)}")
-
-                # RAG Feature: Draft from Knowledge Base
-                if groq_client:
-                    if st.button("📚 Draft from Knowledge Base", key=f"rag_btn_{idx}", use_container_width=True):
-                        knowledge_base = load_knowledge_base()
-                        if not knowledge_base:
-                            st.warning("⚠️ Knowledge base is empty or not found. Please create `knowledge_base.json`.")
-                        else:
-                            with st.spinner("Searching knowledge base and drafting reply..."):
-                                relevant_info = find_relevant_knowledge(email['body'], knowledge_base)
-
-                                if not relevant_info:
-                                    st.info("No relevant information found in the knowledge base for this email.")
-                                else:
-                                    # Prepare a prompt for Groq that includes the relevant context
-                                    context = "\n\n".join([f"Q: {item['question']}\nA: {item['answer']}" for item in relevant_info])
-                                    prompt = (
-                                        f"You are an AI assistant. Use the following context from our knowledge base to draft a reply to the email below. "
-                                        f"Be professional, helpful, and friendly. If the context is not sufficient to answer the question, politely say so.\n\n"
-                                        f"--- Knowledge Base Context ---\n{context}\n\n"
-                                        f"--- Original Email ---\n{email['body']}"
-                                    )
-
-                                    try:
-                                        response = groq_client.chat.completions.create(
-                                            model="llama3-70b-8192",
-                                            messages=[{"role": "user", "content": prompt}]
-                                        )
-                                        draft = response.choices[0].message.content
-                                        st.session_state[f"draft_{idx}"] = draft
-                                        st.success("✅ Draft generated from knowledge base!")
-                                    except Exception as e:
-                                        st.error(f"Error generating RAG reply: {str(e)}")
-
-                # Reply section
-                st.markdown("---")
-                st.markdown("**✏️ Your Reply:**")
-
-                initial_reply = st.session_state.get(f"draft_{idx}", "")
-                reply = st.text_area("", value=initial_reply, height=150, key=f"reply_{idx}", placeholder="Type your reply here or generate one...")
-
-                send_col1, send_col2 = st.columns([1, 3])
-                with send_col1:
-                    if st.button(f"📤 Send Reply", key=f"send_reply_btn_{idx}", use_container_width=True):
-                        if reply.strip():
-                            try:
-                                send_email_reply(
-                                    to=email['sender'],
-                                    subject="Re: " + email['subject'],
-                                    body=reply,
-                                    thread_id=email['thread_id']
-                                )
-                                st.success("✅ Reply sent successfully!")
-                                st.session_state[f"reply_{idx}"] = ""
-                            except Exception as e:
-                                st.error(f"❌ Error sending reply: {str(e)}")
-                        else:
-                            st.warning("Please write a reply before sending.")
+        # AI Features
+        if groq_client:
+            ai_col1, ai_col2 = st.columns(2)
+
+            with ai_col1:
+                summary_key = f"summary_{idx}"
+                if st.button(f"🧠 Summarize", key=f"summarize_btn_{idx}", use_container_width=True):
+                    st.success("📝 **Summary:**")
+                    try:
+                        stream_to_state(
+                            groq_client, summary_prompt(email['body']),
+                            lambda text: st.session_state.__setitem__(summary_key, text),
+                            f"stop_summary_{idx}"
+                        )
+                    except Exception as e:
+                        st.error(f"Error generating summary: {str(e)}")
+                # Keep the summary visible across reruns instead of only right after the click
+                elif st.session_state.get(summary_key):
+                    st.success("📝 **Summary:**")
+                    st.write(st.session_state[summary_key])
+
+            with ai_col2:
+                # Individual draft button remains
+                if st.button(f"✨ Draft Reply", key=f"draft_btn_{idx}", use_container_width=True):
+                    try:
+                        # The reply box below picks up the streamed text once the draft is done
+                        stream_draft(groq_client, idx, draft_reply_prompt(email['body']), f"stop_draft_{idx}")
+                    except Exception as e:
+                        st.error(f"Error drafting reply: {str(e)}")
+
+        # RAG Feature: Draft from Knowledge Base
+        if groq_client:
+            if st.button("📚 Draft from Knowledge Base", key=f"rag_btn_{idx}", use_container_width=True):
+                knowledge_base = load_knowledge_base()
+                if not knowledge_base:
+                    st.warning("⚠️ Knowledge base is empty or not found. Please create `knowledge_base.json`.")
+                else:
+                    with st.spinner("Searching knowledge base..."):
+                        relevant_info = find_relevant_knowledge(
+                            email['body'], knowledge_base, backend=retrieval_backend
+                        )
+
+                    if not relevant_info:
+                        st.info("No relevant information found in the knowledge base for this email.")
+                    else:
+                        # Prepare a prompt for Groq that packs the best-ranked context into the token budget
+                        prompt = kb_draft_prompt(email['body'], relevant_info)
+
+                        try:
+                            stream_draft(groq_client, idx, prompt, f"stop_rag_{idx}")
+                            st.success("✅ Draft generated from knowledge base!")
+                        except Exception as e:
+                            st.error(f"Error generating RAG reply: {str(e)}")
+
+        # A cached draft is the same text every time; this asks the model for a new one
+        cached_prompt = st.session_state.get(f"draft_cached_{idx}")
+        if groq_client and cached_prompt:
+            if st.button("🔄 Regenerate (this draft came from the cache)", key=f"regenerate_btn_{idx}",
+                         use_container_width=True):
+                try:
+                    stream_draft(groq_client, idx, cached_prompt, f"stop_regenerate_{idx}", refresh=True)
+                except Exception as e:
+                    st.error(f"Error regenerating reply: {str(e)}")
+
+        # Reply section
+        st.markdown("---")
+        st.markdown("**✏️ Your Reply:**")
+
+        initial_reply = st.session_state.get(f"draft_{idx}", "")
+        reply = st.text_area(
+            "", value=initial_reply, height=150, key=f"reply_{idx}", placeholder="Type your reply here or generate one...",
+            on_change=save_reply, args=(idx,)
+        )
+
+        send_col1, send_col2 = st.columns([1, 3])
+        with send_col1:
+            if st.button(f"📤 Send Reply", key=f"send_reply_btn_{idx}", use_container_width=True):
+                if reply.strip():
+                    try:
+                        reply_to_email(email, reply)
+                        st.success("✅ Reply sent successfully!")
+                        set_draft(idx, "")
+                    except Exception as e:
+                        st.error(f"❌ Error sending reply: {str(e)}")
+                else:
+                    st.warning("Please write a reply before sending.")
+
+        # Near-duplicates of this email can take the same reply in one go
+        similar = [member for member in clusters[idx] if member != idx]
+        if similar:
+            st.markdown("---")
+            st.markdown(f"**🔗 {len(similar)} similar email(s):** " + ", ".join(
+                f"{emails[member]['sender']}" for member in similar[:5]
+            ) + (" …" if len(similar) > 5 else ""))
+            st.checkbox(
+                "👀 I reviewed this reply", value=idx in st.session_state.reviewed_emails, key=f"reviewed_{idx}",
+                on_change=save_review, args=(idx,)
+            )
+            sim_col1, sim_col2, sim_col3 = st.columns(3)
+            with sim_col1:
+                if st.button("☑️ Select similar", key=f"select_similar_{idx}", use_container_width=True):
+                    st.session_state.selected_emails.update(clusters[idx])
+                    refresh_email_table()
+                    st.rerun()
+            with sim_col2:
+                if st.button("📋 Use reply for similar", key=f"copy_similar_{idx}", use_container_width=True):
+                    if reply.strip():
+                        for member in similar:
+                            set_draft(member, reply, shared=True)
+                        st.success(f"✅ Reply copied to {len(similar)} similar email(s); open each to review it")
+                    else:
+                        st.warning("Please write a reply first.")
+            with sim_col3:
+                if st.button("📨 Send to all similar", key=f"send_similar_{idx}", use_container_width=True):
+                    # Each member gets its own draft, and only once every one of them has been reviewed
+                    unreviewed = [
+                        member for member in clusters[idx]
+                        if member not in st.session_state.reviewed_emails
+                        or not st.session_state.get(f"draft_{member}", "").strip()
+                    ]
+                    if unreviewed:
+                        st.warning(
+                            f"⚠️ Review the reply of each similar email first; {len(unreviewed)} not reviewed: "
+                            + ", ".join(emails[member]['sender'] for member in unreviewed[:5])
+                            + (" …" if len(unreviewed) > 5 else "")
+                        )
+                    else:
+                        send_with_progress({
+                            member: (emails[member], st.session_state[f"draft_{member}"]) for member in clusters[idx]
+                        })
 
 elif st.session_state.authenticated and not st.session_state.emails:
     st.info("📭 No unread emails to display. Click 'Load Unread Emails' to refresh.")
@@ -310,3 +791,5 @@ elif not st.session_state.authenticated:
     2. Load your unread emails
     3. Use AI features to manage your inbox efficiently!
     """)
+
+render_diagnostics(diagnostics)
@@ -0,0 +1,30 @@
+from clustering import cluster_emails
+
+FORM = "New contact form submission\nFrom: {name} <{address}>\nMessage: {message}"
+OUTAGE = (
+    "Hi, since this morning the dashboard shows an error 500 when I open the reports page "
+    "and none of my scheduled exports have arrived. Can you look into it?"
+)
+
+
+def email(body):
+    return {'body': body, 'subject': ''}
+
+
+def test_form_submissions_asking_different_things_stay_apart():
+    emails = [
+        email(FORM.format(name="Jane", address="jane@x.com",
+                          message="I was charged twice for order 1182, please refund one of the charges.")),
+        email(FORM.format(name="Sam", address="sam@y.com",
+                          message="Please cancel my subscription at the end of this billing period.")),
+    ]
+    assert cluster_emails(emails) == [[0], [1]]
+
+
+def test_near_identical_emails_cluster():
+    emails = [email(OUTAGE), email("Something else entirely: where do I change my password?"), email(OUTAGE + "\n\nThanks")]
+    assert cluster_emails(emails) == [[0, 2], [1]]
+
+
+def test_short_emails_never_cluster():
+    assert cluster_emails([email("Thanks!"), email("Thanks!")]) == [[0], [1]]
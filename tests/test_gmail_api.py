@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import gmail_api
+from bench_fakes import FakeGmailService, FakeRequest, http_error
+from gmail_api import get_unread_emails, gmail_service, sync_unread_emails
+from message_store import MessageStore
+
+
+def test_service_pool_is_shared_across_threads(monkeypatch):
+    creds = object()
+    monkeypatch.setattr(gmail_api, "get_credentials", lambda account="default": creds)
+    gmail_api.reset_gmail_service()
+
+    def checkout(out):
+        with gmail_service("pooled") as service:
+            out.append(service)
+
+    seen = []
+    for _ in range(2):
+        # A new thread per call, like a Streamlit rerun
+        thread = threading.Thread(target=checkout, args=(seen,))
+        thread.start()
+        thread.join()
+    assert seen[0] is seen[1]
+
+    # Concurrent checkouts never share a service
+    with gmail_service("pooled") as first, gmail_service("pooled") as second:
+        assert first is not second
+    gmail_api.reset_gmail_service()
+
+
+def test_batch_skips_deleted_messages_and_retries_rate_limited_ones():
+    service = FakeGmailService(10, latency=0)
+    listed = list(service.order)
+    # Rate limited inside the batch, then fine on its own
+    service.batch_errors = {listed[2]: 429, listed[7]: 429}
+    # Deleted between messages.list and the batched get
+    del service.messages[listed[5]]
+
+    emails = get_unread_emails(service=service)
+
+    assert [email['id'] for email in emails] == [m for m in listed if m != listed[5]]
+    # One list, one batch, two individual retries
+    assert service.round_trips == 4
+
+
+def test_batch_raises_non_retryable_errors():
+    service = FakeGmailService(3, latency=0)
+    service.batch_errors = {service.order[1]: 401}
+    with pytest.raises(HttpError):
+        get_unread_emails(service=service)
+
+
+def test_only_the_first_page_is_small(monkeypatch):
+    service = FakeGmailService(120, latency=0)
+    sizes = []
+    list_page = service._list
+    monkeypatch.setattr(service, "_list", lambda max_results, page_token: sizes.append(max_results)
+                        or list_page(max_results, page_token))
+
+    emails = list(gmail_api.iter_unread_emails(page_size=gmail_api.MAX_PAGE_SIZE, first_page_size=25,
+                                               max_results=100, service=service))
+
+    assert len(emails) == 100
+    assert sizes == [25, 75]
+
+
+def synced_inbox(tmp_path, message_count=5):
+    """A fake inbox and a store that has been through one full sync of it."""
+    service = FakeGmailService(message_count, latency=0)
+    store = MessageStore(str(tmp_path / "messages.db"))
+    list(sync_unread_emails(store, service=service))
+    return service, store
+
+
+def test_second_sync_only_fetches_history_and_new_mail(tmp_path):
+    service, store = synced_inbox(tmp_path)
+    service.add_messages(3)
+    service.round_trips = 0
+
+    emails = list(sync_unread_emails(store, service=service))
+
+    # One history.list call and one batch for the three new messages
+    assert service.round_trips == 2
+    assert [email['id'] for email in emails] == service.order
+
+
+def test_read_email_drops_out_of_unread(tmp_path):
+    service, store = synced_inbox(tmp_path)
+    read_id = service.order[1]
+    service.history_id += 1
+    service.history.append({"id": str(service.history_id), "labelsRemoved": [
+        {"message": {"id": read_id, "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}
+    ]})
+
+    emails = list(sync_unread_emails(store, service=service))
+
+    assert read_id not in [email['id'] for email in emails]
+    assert len(emails) == 4
+    assert read_id not in [email['id'] for email in store.unread_emails()]
+
+
+def test_expired_history_id_falls_back_to_full_resync(tmp_path, monkeypatch):
+    service, store = synced_inbox(tmp_path)
+    service.add_messages(2)
+
+    def expired(*args, **kwargs):
+        raise http_error(404, "notFound")
+
+    monkeypatch.setattr(service, "_history_list", lambda *args, **kwargs: FakeRequest(service, expired))
+
+    emails = list(sync_unread_emails(store, service=service))
+
+    assert [email['id'] for email in emails] == service.order
+    assert store.get_history_id() == str(service.history_id)
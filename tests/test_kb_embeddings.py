@@ -0,0 +1,46 @@
+import kb_embeddings
+from kb_embeddings import HashingEmbedder, get_embedding_index
+
+KB = [
+    {"question": "How do I reset my password?", "answer": "Use the forgot password link."},
+    {"question": "Where is my order?", "answer": "Track it from the orders page."},
+]
+
+
+def test_unchanged_knowledge_base_is_not_rehashed(tmp_path, monkeypatch):
+    path = str(tmp_path / "kb.vectors.npy")
+    knowledge_base = list(KB)
+    index = get_embedding_index(knowledge_base, path, HashingEmbedder())
+
+    def fail(entry):
+        raise AssertionError("entries re-hashed for an unchanged knowledge base")
+
+    monkeypatch.setattr(kb_embeddings, "entry_hash", fail)
+    assert get_embedding_index(knowledge_base, path) is index
+    assert index.search("reset password", top_k=1)[0][0] == 0
+
+
+def test_appended_entries_are_embedded(tmp_path):
+    path = str(tmp_path / "kb.vectors.npy")
+    get_embedding_index(list(KB), path, HashingEmbedder())
+    grown = KB + [{"question": "Can I get a refund?", "answer": "Refunds take five days."}]
+    index = get_embedding_index(grown, path)
+    assert len(index.hashes) == 3
+    assert index.search("refund", top_k=1)[0][0] == 2
+
+
+def test_off_topic_query_returns_nothing(tmp_path):
+    knowledge_base = [
+        {"question": "What is your return policy?",
+         "answer": "You can return any item within 30 days of purchase for a full refund or exchange."},
+        {"question": "How can I track my order?",
+         "answer": "Once your order has shipped, you will receive an email with a tracking number."},
+        {"question": "Do you offer international shipping?",
+         "answer": "Yes, we ship to most countries worldwide. Shipping costs vary by destination."},
+    ]
+    index = get_embedding_index(knowledge_base, str(tmp_path / "kb.vectors.npy"), HashingEmbedder())
+
+    assert index.search("Lunch on Friday with the marketing team? Let's meet at noon near the office.") == []
+    assert index.search("Do you deliver to Canada? How much does shipping cost?", top_k=1)[0][0] == 2
+    # The threshold can be lowered per call
+    assert index.search("Lunch on Friday with the marketing team?", min_similarity=-1.0)
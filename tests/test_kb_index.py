@@ -0,0 +1,27 @@
+from kb_index import KnowledgeIndex, get_index
+
+KB = [
+    {"question": "How do I reset my password?", "answer": "Use the forgot password link."},
+    {"question": "Where is my order?", "answer": "Track it from the orders page."},
+]
+
+
+def test_unchanged_knowledge_base_skips_key_check(tmp_path, monkeypatch):
+    path = str(tmp_path / "kb.index.jsonl")
+    knowledge_base = list(KB)
+    index = get_index(knowledge_base, path)
+
+    def fail(self, knowledge_base):
+        raise AssertionError("keys re-checked for an unchanged knowledge base")
+
+    monkeypatch.setattr(KnowledgeIndex, "matches", fail)
+    assert get_index(knowledge_base, path) is index
+
+
+def test_appended_entries_are_indexed(tmp_path):
+    path = str(tmp_path / "kb.index.jsonl")
+    get_index(list(KB), path)
+    grown = KB + [{"question": "Can I get a refund?", "answer": "Refunds take five days."}]
+    index = get_index(grown, path)
+    assert len(index) == 3
+    assert index.search("refund", top_k=1)[0][0] == 2
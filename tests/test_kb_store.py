@@ -0,0 +1,71 @@
+import itertools
+import json
+import os
+
+from gmail_api import load_knowledge_base, search_knowledge
+from kb_store import KnowledgeStore
+
+KB = [
+    {"question": "How do I reset my password?", "answer": "Use the forgot password link."},
+    {"question": "Where is my order?", "answer": "Track it from the orders page."},
+    {"question": "Do you ship abroad?", "answer": "Yes, to most countries."},
+]
+
+_mtimes = itertools.count(1)
+
+
+def write_json(path, entries):
+    with open(path, "w") as f:
+        json.dump(entries, f)
+    # Distinct mtimes even when two writes land in the same clock tick
+    mtime = next(_mtimes) * 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_json_edits_and_removals_are_imported(tmp_path):
+    path = str(tmp_path / "kb.json")
+    write_json(path, KB)
+    store = KnowledgeStore(path)
+    assert store.entries() == KB
+
+    edited = [dict(KB[0], answer="Ask support for a reset email."), KB[2]]
+    write_json(path, edited)
+
+    # The running store notices the edit, and so does a freshly opened one
+    assert store.entries() == edited
+    assert KnowledgeStore(path).entries() == edited
+
+    # Exporting keeps the hand edits
+    store.export_json()
+    with open(path) as f:
+        assert json.load(f) == edited
+
+
+def test_uploaded_entries_survive_json_edits(tmp_path):
+    path = str(tmp_path / "kb.json")
+    write_json(path, KB[:1])
+    store = KnowledgeStore(path)
+    store.add_entries([KB[1]])
+    write_json(path, [KB[0], KB[2]])
+    assert store.entries() == [KB[0], KB[1], KB[2]]
+
+
+def test_json_created_while_running_is_loaded(tmp_path):
+    path = str(tmp_path / "kb.json")
+    assert load_knowledge_base(path) == []
+    write_json(path, KB)
+    assert load_knowledge_base(path) == KB
+
+
+def test_edited_answer_is_reindexed(tmp_path):
+    path = str(tmp_path / "kb.json")
+    write_json(path, KB)
+    for backend in ("bm25", "semantic"):
+        # Build both indexes before the edit
+        search_knowledge("warranty repair", load_knowledge_base(path), file_path=path, backend=backend)
+
+    write_json(path, [dict(KB[0], answer="Warranty repairs are free for two years."), KB[1], KB[2]])
+    knowledge_base = load_knowledge_base(path)
+    for backend in ("bm25", "semantic"):
+        [(entry, _)] = search_knowledge("warranty repair", knowledge_base, file_path=path, backend=backend, top_k=1)
+        assert entry['answer'].startswith("Warranty")
@@ -0,0 +1,110 @@
+import threading
+from types import SimpleNamespace
+
+from llm_cache import LLMCache
+from llm_engine import chat_completion, generate_drafts, stream_completion
+from rate_limit import RateLimiter
+
+
+class FakeApiError(Exception):
+    def __init__(self, status):
+        super().__init__(f"Error code: {status}")
+        self.status_code = status
+
+
+class ScriptedClient:
+    """Groq-compatible client whose replies come from `respond(content)` for the last message's content."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        content = messages[-1]['content']
+        self.calls.append(content)
+        reply = self.respond(content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=None)
+
+
+def prompt(text):
+    return [{"role": "user", "content": text}]
+
+
+def failing_then(failures, reply="Thanks!"):
+    """A respond() that raises `failures` in order, then answers `reply`."""
+    failures = list(failures)
+
+    def respond(content):
+        if failures:
+            raise failures.pop(0)
+        return reply
+    return respond
+
+
+def test_rate_limited_completion_is_retried(monkeypatch):
+    monkeypatch.setattr("rate_limit.time.sleep", lambda seconds: None)
+    client = ScriptedClient(failing_then([FakeApiError(429), FakeApiError(429)]))
+    assert chat_completion(client, prompt("hi")) == "Thanks!"
+    assert len(client.calls) == 3
+
+
+def test_bad_request_is_not_retried(monkeypatch):
+    monkeypatch.setattr("rate_limit.time.sleep", lambda seconds: None)
+    client = ScriptedClient(failing_then([FakeApiError(400)]))
+    results = list(generate_drafts(client, {"a": prompt("hi")}))
+    assert len(client.calls) == 1
+    [(key, text, error)] = results
+    assert key == "a" and text is None and error.status_code == 400
+
+
+def test_drafts_are_yielded_as_each_one_finishes():
+    fast_seen = threading.Event()
+
+    def respond(content):
+        if content == "slow":
+            # Only finishes once the caller has already received the fast draft
+            assert fast_seen.wait(5)
+        return f"re: {content}"
+
+    client = ScriptedClient(respond)
+    results = []
+    for key, text, error in generate_drafts(client, [("slow", prompt("slow")), ("fast", prompt("fast"))], max_workers=2):
+        results.append((key, text, error))
+        if key == "fast":
+            fast_seen.set()
+    assert results == [("fast", "re: fast", None), ("slow", "re: slow", None)]
+
+
+def test_refresh_skips_the_cache_but_stores_the_new_reply(tmp_path):
+    replies = iter(["first", "second"])
+    client = ScriptedClient(lambda content: next(replies))
+    cache = LLMCache(str(tmp_path / "llm_cache.db"))
+
+    assert chat_completion(client, prompt("hi"), cache=cache) == "first"
+    assert chat_completion(client, prompt("hi"), cache=cache) == "first"
+    assert chat_completion(client, prompt("hi"), cache=cache, refresh=True) == "second"
+    assert len(client.calls) == 2
+
+    stats = {}
+    assert list(stream_completion(client, prompt("hi"), cache=cache, stats=stats)) == ["second"]
+    assert stats['cached']
+
+
+def test_limiter_blocks_once_the_minute_budget_is_used(monkeypatch):
+    clock = [1000.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr("rate_limit.time.monotonic", lambda: clock[0])
+    monkeypatch.setattr("rate_limit.time.sleep", fake_sleep)
+    limiter = RateLimiter(requests_per_minute=2)
+    limiter.acquire()
+    limiter.acquire()
+    assert sleeps == []
+    limiter.acquire()
+    # One request per 30 seconds refills the bucket
+    assert sum(sleeps) == 30
@@ -0,0 +1,30 @@
+from prompt_builder import draft_reply_prompt, strip_quoted_and_signature
+
+FORM_BODY = (
+    "New contact form submission\n"
+    "From: Jane <jane@x.com>\n"
+    "Message: My invoice was charged twice, can you refund one of the charges?"
+)
+
+
+def test_form_from_line_is_kept():
+    assert strip_quoted_and_signature(FORM_BODY) == FORM_BODY
+    content = draft_reply_prompt(FORM_BODY)['messages'][-1]['content']
+    assert "charged twice" in content
+
+
+def test_outlook_header_block_is_stripped():
+    body = (
+        "Thanks, that fixed it.\n\n"
+        "From: Support <support@example.com>\n"
+        "Sent: Monday, January 1, 2024 9:00 AM\n"
+        "To: Jane <jane@x.com>\n"
+        "Subject: RE: Login problem\n\n"
+        "Please try resetting your password."
+    )
+    assert strip_quoted_and_signature(body) == "Thanks, that fixed it."
+
+
+def test_on_wrote_and_signature_are_stripped():
+    body = "Where is my order?\n\n--\nJane\n\nOn Mon, Jan 1, 2024 Support wrote:\n> Hello"
+    assert strip_quoted_and_signature(body) == "Where is my order?"
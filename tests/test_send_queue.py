@@ -0,0 +1,50 @@
+import send_queue
+from rate_limit import RateLimiter
+from send_queue import send_replies
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status, reason=""):
+        super().__init__(f"<HttpError {status}: {reason}>")
+        self.status_code = status
+
+
+def run_sends(monkeypatch, failures):
+    """Send one reply whose first attempts raise `failures` in order; returns (result, attempts)."""
+    calls = []
+
+    def fake_reply(email, body):
+        calls.append(body)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return {'id': 'sent1'}
+
+    monkeypatch.setattr(send_queue, "reply_to_email", fake_reply)
+    monkeypatch.setattr("rate_limit.time.sleep", lambda seconds: None)
+    results, stats = send_replies({0: ({'account': 'default'}, "Hello")}, rate_limiter=RateLimiter(60000))
+    return results[0], stats, len(calls)
+
+
+def test_rate_limited_send_is_retried(monkeypatch):
+    result, stats, calls = run_sends(monkeypatch, [FakeHttpError(429), FakeHttpError(403, "userRateLimitExceeded")])
+    assert result['ok'] and result['outcome'] == "sent"
+    assert calls == 3
+    assert stats['sent'] == 1
+
+
+def test_timeout_is_not_retried_and_reported_unknown(monkeypatch):
+    result, stats, calls = run_sends(monkeypatch, [TimeoutError("read timed out")])
+    assert calls == 1
+    assert not result['ok'] and result['outcome'] == "unknown"
+    assert stats == dict(stats, sent=0, failed=0, unknown=1)
+
+
+def test_server_error_is_not_retried(monkeypatch):
+    result, _, calls = run_sends(monkeypatch, [FakeHttpError(503)])
+    assert calls == 1 and result['outcome'] == "unknown"
+
+
+def test_bad_request_fails(monkeypatch):
+    result, stats, calls = run_sends(monkeypatch, [FakeHttpError(400, "invalidArgument")])
+    assert calls == 1 and result['outcome'] == "failed"
+    assert stats['failed'] == 1